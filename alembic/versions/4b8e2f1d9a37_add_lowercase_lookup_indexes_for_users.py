@@ -0,0 +1,37 @@
+"""Add lowercase lookup indexes for users
+
+Revision ID: 4b8e2f1d9a37
+Revises: 2e01c643cfd9
+Create Date: 2026-10-18 09:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2f1d9a37'
+down_revision = '2e01c643cfd9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Expression indexes are supported by both SQLite and Postgres
+    op.create_index(
+        'ix_users_email_lower',
+        'users',
+        [sa.text('lower(email)')],
+        unique=False,
+    )
+    op.create_index(
+        'ix_users_username_lower',
+        'users',
+        [sa.text('lower(username)')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_username_lower', table_name='users')
+    op.drop_index('ix_users_email_lower', table_name='users')
@@ -0,0 +1,125 @@
+"""Add full text search index
+
+Revision ID: 8e6a4c2b7d95
+Revises: d5f07b3a2c14
+Create Date: 2026-10-18 14:20:53.904127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e6a4c2b7d95'
+down_revision = 'd5f07b3a2c14'
+branch_labels = None
+depends_on = None
+
+# Snapshot of SQLITE_DDL in app/search.py
+SQLITE_DDL = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS rating_items_fts USING fts5(
+        title, address,
+        content='rating_items', content_rowid='id', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_insert
+    AFTER INSERT ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rowid, title, address)
+        VALUES (new.id, new.title, new.address);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_delete
+    AFTER DELETE ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rating_items_fts, rowid, title, address)
+        VALUES ('delete', old.id, old.title, old.address);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_update
+    AFTER UPDATE OF title, address ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rating_items_fts, rowid, title, address)
+        VALUES ('delete', old.id, old.title, old.address);
+        INSERT INTO rating_items_fts(rowid, title, address)
+        VALUES (new.id, new.title, new.address);
+    END
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ratings_fts USING fts5(
+        description,
+        content='ratings', content_rowid='id', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_insert
+    AFTER INSERT ON ratings BEGIN
+        INSERT INTO ratings_fts(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_delete
+    AFTER DELETE ON ratings BEGIN
+        INSERT INTO ratings_fts(ratings_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_update
+    AFTER UPDATE OF description ON ratings BEGIN
+        INSERT INTO ratings_fts(ratings_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO ratings_fts(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS ratings_fts_update',
+    'DROP TRIGGER IF EXISTS ratings_fts_delete',
+    'DROP TRIGGER IF EXISTS ratings_fts_insert',
+    'DROP TABLE IF EXISTS ratings_fts',
+    'DROP TRIGGER IF EXISTS rating_items_fts_update',
+    'DROP TRIGGER IF EXISTS rating_items_fts_delete',
+    'DROP TRIGGER IF EXISTS rating_items_fts_insert',
+    'DROP TABLE IF EXISTS rating_items_fts',
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index(
+            'ix_rating_items_search',
+            'rating_items',
+            [sa.text(
+                "to_tsvector('simple', title || ' ' || coalesce(address, ''))"
+            )],
+            postgresql_using='gin',
+        )
+        op.create_index(
+            'ix_ratings_search',
+            'ratings',
+            [sa.text("to_tsvector('simple', coalesce(description, ''))")],
+            postgresql_using='gin',
+        )
+        return
+
+    for statement in SQLITE_DDL:
+        op.execute(statement)
+    # Index the rows that predate the triggers
+    op.execute(
+        "INSERT INTO rating_items_fts(rating_items_fts) VALUES ('rebuild')"
+    )
+    op.execute("INSERT INTO ratings_fts(ratings_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_ratings_search', table_name='ratings')
+        op.drop_index('ix_rating_items_search', table_name='rating_items')
+        return
+
+    for statement in SQLITE_DROP:
+        op.execute(statement)
@@ -0,0 +1,69 @@
+"""Add rating item stats table
+
+Revision ID: a3c91d5e0f62
+Revises: 4b8e2f1d9a37
+Create Date: 2026-10-18 11:03:27.118470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91d5e0f62'
+down_revision = '4b8e2f1d9a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('rating_item_stats',
+    sa.Column('itemId', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('rating_mean', sa.Float(), nullable=True),
+    sa.Column('histogram', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['itemId'], ['rating_items.id'], ),
+    sa.PrimaryKeyConstraint('itemId')
+    )
+    op.create_index(op.f('ix_rating_item_stats_rating_mean'), 'rating_item_stats', ['rating_mean'], unique=False)
+
+    # Backfill from the existing ratings, same as `python -m app.cli
+    # rebuild-stats` but without importing the app's models
+    bind = op.get_bind()
+    stats = {
+        item_id: {}
+        for item_id, in bind.execute(sa.text('SELECT id FROM rating_items'))
+    }
+    counts = bind.execute(sa.text(
+        'SELECT "itemId", rating, count(*) FROM ratings '
+        'GROUP BY "itemId", rating'
+    ))
+    for item_id, value, count in counts:
+        stats.setdefault(item_id, {})[str(value)] = count
+    table = sa.table(
+        'rating_item_stats',
+        sa.column('itemId', sa.Integer()),
+        sa.column('rating_count', sa.Integer()),
+        sa.column('rating_sum', sa.Integer()),
+        sa.column('rating_mean', sa.Float()),
+        sa.column('histogram', sa.JSON()),
+    )
+    rows = []
+    for item_id, histogram in stats.items():
+        count = sum(histogram.values())
+        total = sum(int(value) * n for value, n in histogram.items())
+        rows.append({
+            'itemId': item_id,
+            'rating_count': count,
+            'rating_sum': total,
+            'rating_mean': total / count if count else None,
+            'histogram': histogram,
+        })
+    if rows:
+        op.bulk_insert(table, rows)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_rating_item_stats_rating_mean'), table_name='rating_item_stats')
+    op.drop_table('rating_item_stats')
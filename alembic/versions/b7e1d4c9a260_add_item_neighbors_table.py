@@ -0,0 +1,37 @@
+"""Add item neighbors table
+
+Revision ID: b7e1d4c9a260
+Revises: f3b9d2e6c871
+Create Date: 2026-10-18 16:37:12.480915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1d4c9a260'
+down_revision = 'f3b9d2e6c871'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('item_neighbors',
+    sa.Column('itemId', sa.Integer(), nullable=False),
+    sa.Column('neighborId', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['itemId'], ['rating_items.id'], ),
+    sa.ForeignKeyConstraint(['neighborId'], ['rating_items.id'], ),
+    sa.PrimaryKeyConstraint('itemId', 'neighborId')
+    )
+    op.create_index('ix_item_neighbors_neighborId', 'item_neighbors', ['neighborId'], unique=False)
+    # Plain ADD COLUMN, the table is not rebuilt
+    with op.batch_alter_table('rating_item_stats') as batch_op:
+        batch_op.add_column(sa.Column('neighbors_version', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('rating_item_stats', 'neighbors_version')
+    op.drop_index('ix_item_neighbors_neighborId', table_name='item_neighbors')
+    op.drop_table('item_neighbors')
@@ -0,0 +1,26 @@
+"""Index ratings.itemId
+
+Revision ID: c4d8a1f5e392
+Revises: b7e1d4c9a260
+Create Date: 2026-10-18 18:05:27.316842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8a1f5e392'
+down_revision = 'b7e1d4c9a260'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        op.f('ix_ratings_itemId'), 'ratings', ['itemId'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ratings_itemId'), table_name='ratings')
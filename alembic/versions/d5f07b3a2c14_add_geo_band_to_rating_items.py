@@ -0,0 +1,47 @@
+"""Add geo band to rating items
+
+Revision ID: d5f07b3a2c14
+Revises: a3c91d5e0f62
+Create Date: 2026-10-18 12:41:09.672315
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f07b3a2c14'
+down_revision = 'a3c91d5e0f62'
+branch_labels = None
+depends_on = None
+
+# Must match BAND_DEGREES in app/geo.py
+BAND_DEGREES = 0.1
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('rating_items') as batch_op:
+        batch_op.add_column(sa.Column('geo_band', sa.Integer(), nullable=True))
+    op.create_index('ix_rating_items_geo', 'rating_items', ['geo_band', 'longitude'], unique=False)
+
+    # Computed in Python, CAST rounds on Postgres and SQLite lacks FLOOR
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT id, latitude FROM rating_items WHERE latitude IS NOT NULL'
+    )).all()
+    if rows:
+        bind.execute(
+            sa.text('UPDATE rating_items SET geo_band = :band WHERE id = :id'),
+            [
+                {'id': item_id, 'band': math.floor((latitude + 90) / BAND_DEGREES)}
+                for item_id, latitude in rows
+            ],
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rating_items_geo', table_name='rating_items')
+    with op.batch_alter_table('rating_items') as batch_op:
+        batch_op.drop_column('geo_band')
@@ -0,0 +1,35 @@
+"""Add indexes for rating and item lists
+
+Revision ID: d9a3e7b1c458
+Revises: c4d8a1f5e392
+Create Date: 2026-10-18 19:41:09.527314
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a3e7b1c458'
+down_revision = 'c4d8a1f5e392'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # unique_user_item and the latitude and longitude check already come
+    # from 2e01c643cfd9 and 7996204a40bb, the models now declare them too
+    op.create_index(
+        'ix_ratings_userId_id', 'ratings', ['userId', 'id'], unique=False
+    )
+    op.create_index(
+        'ix_rating_items_category_id',
+        'rating_items',
+        ['category', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rating_items_category_id', table_name='rating_items')
+    op.drop_index('ix_ratings_userId_id', table_name='ratings')
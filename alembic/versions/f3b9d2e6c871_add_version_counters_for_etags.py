@@ -0,0 +1,31 @@
+"""Add version counters for etags
+
+Revision ID: f3b9d2e6c871
+Revises: 8e6a4c2b7d95
+Create Date: 2026-10-18 15:02:37.118640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d2e6c871'
+down_revision = '8e6a4c2b7d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Plain ADD COLUMN, neither table is rebuilt
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('ratings_version', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('rating_item_stats') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    # Dropped in place (SQLite 3.35+), a batch rebuild of users would lose
+    # its lower() expression indexes
+    op.drop_column('rating_item_stats', 'version')
+    op.drop_column('users', 'ratings_version')
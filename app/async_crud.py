@@ -0,0 +1,183 @@
+"""Awaitable versions of the CRUD operations in ratings app.
+
+Each function accepts either a blocking ``Session`` or an ``AsyncSession``.
+Blocking sessions are run in the threadpool, async sessions drive the
+functions in ``crud`` through ``run_sync`` on the async driver, so the two
+modes share a single implementation of every query.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas, auth
+
+if TYPE_CHECKING:
+    # Only imported by db.py when RATINGS_ASYNC_DB is set
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def _run(db: Session | AsyncSession, fn, *args, **kwargs):
+    if isinstance(db, Session):
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
+
+
+async def get_user(db: Session | AsyncSession,
+                   user_id: int) -> models.User | None:
+    return await _run(db, crud.get_user, user_id)
+
+
+async def get_user_by_email(db: Session | AsyncSession,
+                            email: str) -> models.User | None:
+    return await _run(db, crud.get_user_by_email, email)
+
+
+async def get_user_by_username(db: Session | AsyncSession,
+                               username: str) -> models.User | None:
+    return await _run(db, crud.get_user_by_username, username)
+
+
+async def get_taken_user_fields(db: Session | AsyncSession,
+                                email: str,
+                                username: str) -> set[str]:
+    return await _run(db, crud.get_taken_user_fields, email, username)
+
+
+async def get_users(db: Session | AsyncSession,
+                    limit: int | None = None,
+                    cursor: int | None = None,
+                    fields: list[str] | None = None) -> list[dict]:
+    return await _run(db, crud.get_users, limit, cursor, fields)
+
+
+async def create_user(db: Session | AsyncSession,
+                      user: schemas.UserCreate) -> schemas.User:
+    # Hash outside of run_sync, which would otherwise block the event loop
+    hashed_password = await auth.hash_password_async(user.password)
+    return await _run(db, crud.create_user, user, hashed_password)
+
+
+async def update_password_hash(db: Session | AsyncSession,
+                               user: models.User,
+                               password_hash: str):
+    return await _run(db, crud.update_password_hash, user, password_hash)
+
+
+async def create_rating_item(db: Session | AsyncSession,
+                             user_id: int,
+                             data: dict) -> models.RatingItem | None:
+    return await _run(db, crud.create_rating_item, user_id, data)
+
+
+async def create_rating(db: Session | AsyncSession,
+                        user_id: int,
+                        data: dict) -> schemas.RatingSuccess | None:
+    return await _run(db, crud.create_rating, user_id, data)
+
+
+async def create_rating_with_item(db: Session | AsyncSession,
+                                  user_id: int,
+                                  item_data: dict,
+                                  rating_data: dict):
+    return await _run(
+        db, crud.create_rating_with_item, user_id, item_data, rating_data
+    )
+
+
+async def create_ratings(db: Session | AsyncSession,
+                         entries: list[tuple[int, dict | None, dict]]
+                         ) -> list[schemas.RatingSuccess | None]:
+    return await _run(db, crud.create_ratings, entries)
+
+
+async def bulk_create_ratings(db: Session | AsyncSession,
+                              user_id: int,
+                              entries: list[dict]) -> list[dict]:
+    return await _run(db, crud.bulk_create_ratings, user_id, entries)
+
+
+async def delete_rating(db: Session | AsyncSession,
+                        user_id, rating_id) -> bool:
+    return await _run(db, crud.delete_rating, user_id, rating_id)
+
+
+async def get_user_ratings(db: Session | AsyncSession,
+                           user_id: int,
+                           limit: int | None = None,
+                           cursor: int | None = None,
+                           fields: list[str] | None = None) -> list[dict]:
+    return await _run(
+        db, crud.get_user_ratings, user_id, limit, cursor, fields
+    )
+
+
+async def get_ratings_version(db: Session | AsyncSession,
+                              user_id: int) -> int | None:
+    return await _run(db, crud.get_ratings_version, user_id)
+
+
+async def stream_user_ratings(db: Session | AsyncSession,
+                              user_id: int,
+                              batch_size: int = 1000):
+    if isinstance(db, Session):
+        batches = crud.iter_user_ratings(db, user_id, batch_size)
+        async for rows in iterate_in_threadpool(batches):
+            yield rows
+        return
+    result = await db.stream(
+        crud.user_ratings_query(user_id).execution_options(
+            stream_results=True
+        )
+    )
+    async for rows in result.mappings().partitions(batch_size):
+        yield [dict(row) for row in rows]
+
+
+async def get_rating_item(db: Session | AsyncSession, item_id: int):
+    return await _run(db, crud.get_rating_item, item_id)
+
+
+async def get_item_version(db: Session | AsyncSession, item_id: int):
+    return await _run(db, crud.get_item_version, item_id)
+
+
+async def delete_rating_item(db: Session | AsyncSession,
+                             user_id, item_id) -> bool:
+    return await _run(db, crud.delete_rating_item, user_id, item_id)
+
+
+async def get_top_items(db: Session | AsyncSession,
+                        limit: int,
+                        category: str | None = None,
+                        min_count: int = 1) -> list[models.RatingItem]:
+    return await _run(db, crud.get_top_items, limit, category, min_count)
+
+
+async def get_recommendations(db: Session | AsyncSession,
+                              user_id: int,
+                              limit: int) -> list:
+    return await _run(db, crud.get_recommendations, user_id, limit)
+
+
+async def get_nearby_items(db: Session | AsyncSession,
+                           latitude: float,
+                           longitude: float,
+                           radius_km: float,
+                           category: str | None = None,
+                           limit: int = 20,
+                           offset: int = 0) -> list:
+    return await _run(
+        db, crud.get_nearby_items,
+        latitude, longitude, radius_km, category, limit, offset,
+    )
+
+
+async def search_items(db: Session | AsyncSession,
+                       q: str,
+                       limit: int = 20,
+                       offset: int = 0) -> list:
+    return await _run(db, crud.search_items, q, limit, offset)
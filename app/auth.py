@@ -1,61 +1,238 @@
 """Authentication functionality for ratings app."""
 
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 
-from . import schemas
+from . import cache, metrics
 
 
 SECRET_KEY = 'tempsecret'
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXP_MINUTES = 1440
 
+# Password hashing runs in its own processes. At most HASH_WORKERS jobs run
+# and HASH_QUEUE_SIZE more wait, anything beyond that is refused with a 503.
+HASH_WORKERS = int(os.environ.get('RATINGS_HASH_WORKERS', os.cpu_count() or 1))
+HASH_QUEUE_SIZE = int(os.environ.get('RATINGS_HASH_QUEUE_SIZE', 32))
+HASH_RETRY_AFTER = int(os.environ.get('RATINGS_HASH_RETRY_AFTER', 1))
+
+# Verified token claims are kept until the token expires
+TOKEN_CACHE_SIZE = int(os.environ.get('RATINGS_TOKEN_CACHE_SIZE', 10000))
+# Import path, as module:Class, of a shared revocation backend
+REVOCATION_BACKEND = os.environ.get('RATINGS_REVOCATION_BACKEND')
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+_pwd_context = None
+_hash_pool = None
+_hash_slots = asyncio.Semaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+
+
+def get_pwd_context():
+    # passlib is loaded on first use, which is in the hashing processes
+    # rather than the workers serving requests
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Return (verified, new_hash), new_hash being set when the stored
+    hash uses deprecated settings and should be replaced."""
+    return get_pwd_context().verify_and_update(
+        plain_password, hashed_password
+    )
 
 
 def hash_password(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+def _timed_call(fn, *args):
+    # Runs in the hashing process, the time excludes waiting for a worker
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+async def run_password_job(fn, *args):
+    # Refuse instead of queueing without bound, so a login storm cannot
+    # pile up work that the rest of the app would wait behind
+    if _hash_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Server busy, try again shortly.',
+            headers={'Retry-After': str(HASH_RETRY_AFTER)},
+        )
+    async with _hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_pool(), fn, *args)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    elapsed, result = await run_password_job(
+        _timed_call,
+        verify_and_update_password, plain_password, hashed_password,
+    )
+    metrics.auth_seconds.observe(elapsed, 'bcrypt_verify')
+    return result
 
 
-def authenticate_user(user: schemas.UserValidate, hash: str):
-    if not verify_password(user.password, hash):
-        return False
-    return user
+async def hash_password_async(password):
+    elapsed, result = await run_password_job(
+        _timed_call, hash_password, password
+    )
+    metrics.auth_seconds.observe(elapsed, 'bcrypt_hash')
+    return result
+
+
+class MemoryRevocationBackend:
+    """Revoked tokens and per-user cutoffs held in process memory.
+
+    Cutoffs are kept by user id and by email, as tokens issued before
+    they carried a uid claim only name the user by their email subject.
+    Entries are dropped once every token they could match has expired.
+    With several workers, point RATINGS_REVOCATION_BACKEND at a class with
+    the same methods backed by a shared store.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._users = {}
+        self._subjects = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        self._tokens = {
+            key: exp for key, exp in self._tokens.items() if exp > now
+        }
+        horizon = now - ACCESS_TOKEN_EXP_MINUTES * 60
+        self._users = {
+            user_id: cutoff
+            for user_id, cutoff in self._users.items() if cutoff > horizon
+        }
+        self._subjects = {
+            subject: cutoff
+            for subject, cutoff in self._subjects.items() if cutoff > horizon
+        }
+
+    def revoke_token(self, token_key: str, expires_at: float):
+        with self._lock:
+            self._prune(time.time())
+            self._tokens[token_key] = expires_at
+
+    def revoke_user(self, user_id: int, email: str, issued_before: float):
+        with self._lock:
+            self._prune(time.time())
+            self._users[user_id] = issued_before
+            self._subjects[email.lower()] = issued_before
+
+    def is_revoked(self, token_key: str, claims: dict) -> bool:
+        if token_key in self._tokens:
+            return True
+        cutoff = self._users.get(claims.get('uid'))
+        if cutoff is None:
+            cutoff = self._subjects.get(str(claims.get('sub')).lower())
+        # Tokens without iat predate it and with it every cutoff
+        return cutoff is not None and claims.get('iat', 0) < cutoff
+
+
+def load_revocation_backend():
+    if not REVOCATION_BACKEND:
+        return MemoryRevocationBackend()
+    module, _, name = REVOCATION_BACKEND.partition(':')
+    return getattr(importlib.import_module(module), name)()
+
+
+revocation = load_revocation_backend()
+token_cache = cache.TTLCache(
+    maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXP_MINUTES * 60
+)
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
 
 
 def create_access_token(data: dict):
+    # Imported on first use, python-jose loads its crypto backends
+    from jose import jwt
+
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXP_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # Float iat so a password change revokes tokens from earlier in the
+    # same second but not the one issued right after it
+    now = time.time()
+    to_encode.update({
+        "iat": now,
+        "exp": int(now) + ACCESS_TOKEN_EXP_MINUTES * 60,
+    })
+    with metrics.timed(metrics.auth_seconds, 'jwt_encode'):
+        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
-    except JWTError:
-        raise credentials_exception
-    email = token_data.email
-    if email is None:
-        raise credentials_exception
-    return email
+def verify_token(token: str) -> dict | None:
+    """Return the token's claims, or None if it is invalid, expired or
+    revoked. Signatures are only checked on the first sight of a token."""
+    key = token_key(token)
+    claims = token_cache.get(key)
+    if claims is None:
+        from jose import JWTError, jwt
+
+        try:
+            with metrics.timed(metrics.auth_seconds, 'jwt_decode'):
+                claims = jwt.decode(
+                    token, SECRET_KEY, algorithms=[ALGORITHM]
+                )
+        except JWTError:
+            return None
+        if claims.get("sub") is None:
+            return None
+        token_cache.set(key, claims, ttl=claims["exp"] - time.time())
+    elif claims["exp"] <= time.time():
+        return None
+    if revocation.is_revoked(key, claims):
+        return None
+    return claims
+
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    claims = verify_token(token)
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {**claims, "token_key": token_key(token)}
@@ -0,0 +1,121 @@
+"""In-process caches for ratings app."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+USER_CACHE_SIZE = int(os.environ.get('RATINGS_USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get('RATINGS_USER_CACHE_TTL', 300))
+# How long a user's reads stay on the primary after they write
+READ_YOUR_WRITES_SECONDS = float(
+    os.environ.get('RATINGS_READ_YOUR_WRITES_SECONDS', 5)
+)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RATINGS_RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_TTL = float(os.environ.get('RATINGS_RESPONSE_CACHE_TTL', 600))
+# Total size of the cached response bodies, a /ratings page can be large
+RESPONSE_CACHE_BYTES = int(
+    os.environ.get('RATINGS_RESPONSE_CACHE_BYTES', 64 * 1024 * 1024)
+)
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after
+    being set, or after their own ttl if one is given to ``set``. Safe to
+    share between the event loop and the threadpool.
+    """
+
+    def __init__(self, maxsize: int, ttl: float,
+                 maxbytes: int | None = None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # With maxbytes, entries are also evicted once the sizes sizeof
+        # gives for them add up to more, and larger ones are not kept
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key):
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, _ = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl: float | None = None):
+        # ttl overrides the cache wide default for this entry
+        ttl = self.ttl if ttl is None else ttl
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.bytes > self.maxbytes
+            ):
+                self._pop(next(iter(self._data)))
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        stats = {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+        if self.maxbytes is not None:
+            stats['bytes'] = self.bytes
+        return stats
+
+
+# Authenticated users keyed by the lowercased token subject (email)
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Ids of users who wrote within the last READ_YOUR_WRITES_SECONDS. This is
+# per process, with several workers a read may land on one that has not
+# seen the write and go to the replica.
+recent_writers = TTLCache(
+    maxsize=USER_CACHE_SIZE, ttl=READ_YOUR_WRITES_SECONDS
+)
+
+# Serialized GET responses keyed by their etag. Etags carry the version
+# counters that crud bumps on every write, so a write makes the old
+# entries unreachable and LRU eviction clears them out. Entries are
+# (body, headers) pairs, weighed by their body.
+response_cache = TTLCache(
+    maxsize=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL,
+    maxbytes=RESPONSE_CACHE_BYTES,
+    sizeof=lambda entry: len(entry[0]),
+)
@@ -0,0 +1,276 @@
+"""Maintenance commands for ratings app.
+
+Usage: python -m app.cli <command>
+"""
+
+import argparse
+import itertools
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+
+# app.db reads its settings from the environment when first imported, so
+# commands import it themselves, after serve has set what it needs
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), '..', 'alembic.ini')
+# Most milliseconds a fresh interpreter may take to import app.main
+IMPORT_BUDGET_MS = 700.0
+
+
+def rebuild_stats(args):
+    from . import crud
+    from .db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_item_stats(db)
+    finally:
+        db.close()
+    print(f'Rebuilt rating aggregates for {count} items.')
+
+
+def refresh_neighbors(args):
+    # Imported here so numpy and scipy are only needed by this job
+    from . import recommend
+    from .db import SessionLocal
+
+    for refreshes in itertools.count(1):
+        # Now and then start over, so lists stored by hand or by an older
+        # version do not linger
+        full = args.full or (
+            args.full_every > 0 and refreshes % args.full_every == 0
+        )
+        db = SessionLocal()
+        try:
+            count = recommend.refresh_neighbors(db, full=full)
+        finally:
+            db.close()
+        print(f'Refreshed item neighbors for {count} items.')
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+def check_query_plans(args):
+    # Development tooling, only found when run from a checkout
+    from benchmarks import queryplans
+
+    problems = queryplans.check()
+    for problem in problems:
+        print(problem, end='\n\n')
+    if problems:
+        raise SystemExit(f'{len(problems)} statements scan whole tables')
+    print('No unexpected full table scans.')
+
+
+def import_time(module: str) -> tuple[float, list[tuple[float, str]]]:
+    """Seconds a fresh interpreter takes to import ``module``, with the
+    (seconds, name) of each module that import loaded, from -X importtime.
+    Run in production mode so the import does not create tables."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env={**os.environ, 'RATINGS_DEV_MODE': '0'},
+        capture_output=True, text=True, check=True,
+    ).stderr
+    loaded = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, total, name = line[len('import time:'):].split('|')
+        if not own.strip().isdigit():
+            # The header line
+            continue
+        if name.strip() == module:
+            return int(total) / 1e6, loaded
+        # Lines are printed as imports finish, so every earlier line
+        # at the top level belongs to an import done before this one
+        if not name.startswith('  '):
+            loaded = []
+        else:
+            loaded.append((int(own) / 1e6, name.strip()))
+    raise RuntimeError(f'{module} was not imported')
+
+
+def check_import_time(args):
+    # The best of several runs, the others mostly measure the machine
+    seconds, loaded = min(
+        import_time('app.main') for _ in range(args.repeats)
+    )
+    print(f'import app.main: {seconds * 1000:.0f} ms, '
+          f'budget {args.budget_ms:.0f} ms')
+    print('Slowest modules, excluding their own imports:')
+    for own, name in sorted(loaded, reverse=True)[:args.top]:
+        print(f'{own * 1000:8.1f} ms  {name}')
+    if seconds * 1000 > args.budget_ms:
+        raise SystemExit('import app.main is over budget')
+
+
+def migrate():
+    """Bring the database up to the latest migration. An empty database
+    gets its tables straight from the models instead of replaying every
+    migration, and is stamped as up to date."""
+    from alembic import command
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from sqlalchemy import inspect
+
+    from . import db, models
+
+    config = Config(ALEMBIC_INI)
+    # The app's own URL, escaped for the ini file's interpolation
+    config.set_main_option(
+        'sqlalchemy.url', db.SQLALCHEMY_DATABASE_URL.replace('%', '%%')
+    )
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        revision = context.get_current_revision()
+        tables = inspect(connection).get_table_names()
+    if revision is not None:
+        command.upgrade(config, 'head')
+    elif not tables:
+        models.Base.metadata.create_all(bind=db.engine)
+        command.stamp(config, 'head')
+    else:
+        raise SystemExit(
+            'The database has tables but no migration revision, it was '
+            'created in development mode. Run alembic stamp with the '
+            'revision matching its schema, then serve again.'
+        )
+
+
+def serve(args):
+    """Migrate once, then run uvicorn workers that share one listening
+    socket. SIGHUP replaces the workers one at a time, each replacement
+    serving before the worker it replaces is stopped.
+
+    Development mode, which creates missing tables on import and is on
+    unless RATINGS_DEV_MODE says otherwise, is always off here."""
+    import uvicorn
+
+    # Set before app.db is first imported, both here and in the workers,
+    # so a single worker serving from this process sees them too
+    os.environ['RATINGS_DEV_MODE'] = '0'
+    if args.db_connections:
+        per_worker = max(1, args.db_connections // args.workers)
+        os.environ['RATINGS_DB_POOL_SIZE'] = str(per_worker)
+        os.environ['RATINGS_DB_MAX_OVERFLOW'] = '0'
+    from . import db
+
+    migrate()
+    db.engine.dispose()
+    uvicorn.run(
+        'app.main:app',
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+def replicate(args):
+    """Stand-in for replication when trying a read replica locally: copy
+    the primary SQLite database onto the replica with the backup API."""
+    from . import db
+
+    source_url, target_url = db.engine.url, db.read_engine.url
+    if (db.read_engine is db.engine
+            or not db.is_sqlite(str(source_url))
+            or not db.is_sqlite(str(target_url))):
+        raise SystemExit(
+            'replicate needs SQLite DATABASE_URL and REPLICA_DATABASE_URL'
+        )
+    while True:
+        source = sqlite3.connect(source_url.database)
+        target = sqlite3.connect(target_url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.cli')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = commands.add_parser(
+        'rebuild-stats',
+        help='recompute every item\'s rating aggregates from scratch',
+    )
+    rebuild.set_defaults(func=rebuild_stats)
+
+    neighbors = commands.add_parser(
+        'refresh-neighbors',
+        help='update the item similarities behind recommendations',
+    )
+    neighbors.add_argument('--full', action='store_true',
+                           help='recompute every item, not only changed '
+                           'ones')
+    neighbors.add_argument('--interval', type=float, default=60.0,
+                           help='seconds between refreshes')
+    neighbors.add_argument('--full-every', type=int, default=60,
+                           help='make every nth refresh a full one, 0 for '
+                           'never')
+    neighbors.add_argument('--once', action='store_true',
+                           help='refresh once and exit')
+    neighbors.set_defaults(func=refresh_neighbors)
+
+    plans = commands.add_parser(
+        'check-query-plans',
+        help='fail if a crud query scans a whole table',
+    )
+    plans.set_defaults(func=check_query_plans)
+
+    imports = commands.add_parser(
+        'check-import-time',
+        help='fail if importing app.main takes longer than a budget',
+    )
+    imports.add_argument('--budget-ms', type=float,
+                         default=IMPORT_BUDGET_MS)
+    imports.add_argument('--repeats', type=int, default=5,
+                         help='imports to take the fastest of')
+    imports.add_argument('--top', type=int, default=10,
+                         help='slowest modules to list')
+    imports.set_defaults(func=check_import_time)
+
+    server = commands.add_parser(
+        'serve',
+        help='migrate the database, then serve the app from worker '
+        'processes with development mode off',
+    )
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8000)
+    server.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_CONCURRENCY', 1)),
+                        help='worker processes, WEB_CONCURRENCY by default')
+    server.add_argument('--db-connections', type=int,
+                        help='most database connections for all workers '
+                        'together, split evenly between them')
+    server.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker has to finish its '
+                        'requests')
+    server.add_argument('--log-level', default='info')
+    server.set_defaults(func=serve)
+
+    copy = commands.add_parser(
+        'replicate',
+        help='keep a local SQLite replica in sync with the primary',
+    )
+    copy.add_argument('--interval', type=float, default=1.0,
+                      help='seconds between copies')
+    copy.add_argument('--once', action='store_true',
+                      help='copy once and exit')
+    copy.set_defaults(func=replicate)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
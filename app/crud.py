@@ -1,10 +1,61 @@
 """Utility functions for effecting CRUD operations in ratings app."""
 
+import heapq
+from collections import Counter, defaultdict
+
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import (
+    bindparam,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    tuple_,
+    update,
+)
 from sqlalchemy.exc import IntegrityError
 
-from . import models, schemas, auth
+from . import models, schemas, auth, cache, geo, search
+
+
+BULK_CHUNK_SIZE = 500
+
+# Ratings above this count as liking an item and below as disliking it,
+# both for item similarity and for weighing recommendations
+NEUTRAL_RATING = 3
+
+# Columns that list endpoints may project, keyed by their response field
+USER_FIELDS = {
+    'id': models.User.id,
+    'email': models.User.email,
+    'username': models.User.username,
+    'first_name': models.User.first_name,
+    'last_name': models.User.last_name,
+}
+RATING_FIELDS = {
+    'id': models.Rating.id,
+    'rating': models.Rating.rating,
+    'itemId': models.Rating.itemId,
+    'userId': models.Rating.userId,
+    'description': models.Rating.description,
+    'title': models.RatingItem.title,
+}
+
+
+def _chunks(values: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _columns(available: dict, fields: list[str] | None) -> list:
+    # id is always selected as it is the pagination cursor
+    names = fields or list(available)
+    if 'id' not in names:
+        names = ['id', *names]
+    return [available[name].label(name) for name in names]
 
 
 def get_user(db: Session, user_id: int) -> models.User | None:
@@ -13,22 +64,67 @@ def get_user(db: Session, user_id: int) -> models.User | None:
 
 def get_user_by_email(db: Session, email: str) -> models.User | None:
     return db.query(models.User).filter(
-        models.User.email.ilike(email)
+        func.lower(models.User.email) == func.lower(email)
     ).first()
 
 
 def get_user_by_username(db: Session, username: str) -> models.User | None:
     return db.query(models.User).filter(
-        models.User.username.ilike(username)
+        func.lower(models.User.username) == func.lower(username)
     ).first()
 
 
-def get_users(db: Session) -> list:
-    return db.query(models.User).all()
+def get_taken_user_fields(db: Session,
+                          email: str,
+                          username: str) -> set[str]:
+    """Which of 'email' and 'username' already belong to a user, ignoring
+    case, found with a single query over both lower() indexes."""
+    rows = db.execute(
+        select(models.User.email, models.User.username).where(
+            or_(
+                func.lower(models.User.email) == func.lower(email),
+                func.lower(models.User.username) == func.lower(username),
+            )
+        ).limit(2)
+    ).all()
+    taken = set()
+    for row in rows:
+        if row.email.lower() == email.lower():
+            taken.add('email')
+        if row.username.lower() == username.lower():
+            taken.add('username')
+    return taken
+
 
+@event.listens_for(models.User, 'after_update')
+@event.listens_for(models.User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target: models.User):
+    # Drop the current email and, if it was just changed, the old one too
+    emails = [target.email, *inspect(target).attrs.email.history.deleted]
+    for email in emails:
+        if email:
+            cache.user_cache.invalidate(email.lower())
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = auth.hash_password(user.password)
+
+def get_users(db: Session,
+              limit: int | None = None,
+              cursor: int | None = None,
+              fields: list[str] | None = None) -> list[dict]:
+    query = select(
+        *_columns(USER_FIELDS, fields)
+    ).order_by(models.User.id)
+    if cursor is not None:
+        query = query.where(models.User.id > cursor)
+    if limit is not None:
+        query = query.limit(limit)
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+def create_user(db: Session,
+                user: schemas.UserCreate,
+                hashed_password: str | None = None) -> schemas.User:
+    if hashed_password is None:
+        hashed_password = auth.hash_password(user.password)
     db_user = models.User(
         email=user.email,
         password_hash=hashed_password,
@@ -37,9 +133,124 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
         last_name=user.last_name,
     )
     db.add(db_user)
+    db.flush()
+    # Read before the commit expires it, saving a refresh round trip
+    result = schemas.User.from_orm(db_user)
+    db.commit()
+    return result
+
+
+def update_password_hash(db: Session,
+                         user: models.User,
+                         password_hash: str):
+    user.password_hash = password_hash
     db.commit()
-    db.refresh(db_user)
-    return db_user
+
+
+def _update_item_stats(db: Session, changes: dict[int, Counter]) -> set:
+    """Apply rating count changes, given per item as a Counter of
+    {rating value: +n or -n}, to the items' aggregate rows, and return
+    the ids among them that name no item.
+
+    Callers flush their rating writes first, so the database write lock
+    (or on Postgres the row lock taken here) is held while the rows are
+    read and rewritten. Rows are written with one executemany per chunk.
+    Items without a row, which predate the aggregates, get one, but ids
+    without an item never do: SQLite does not enforce the foreign key,
+    and the row would block the item that is later given that id.
+    """
+    table = models.RatingItemStats.__table__
+    missing = set()
+    for chunk in _chunks(list(changes)):
+        rows = {
+            row.itemId: row
+            for row in db.execute(
+                select(table).where(
+                    table.c.itemId.in_(chunk)
+                ).with_for_update()
+            )
+        }
+        updates, inserts = [], []
+        for item_id in chunk:
+            row = rows.get(item_id)
+            count = row.rating_count if row else 0
+            total = row.rating_sum if row else 0
+            histogram = dict(row.histogram) if row else {}
+            for value, delta in changes[item_id].items():
+                key = str(value)
+                histogram[key] = histogram.get(key, 0) + delta
+                if histogram[key] <= 0:
+                    del histogram[key]
+                count += delta
+                total += delta * value
+            values = {
+                'version': row.version + 1 if row else 0,
+                'rating_count': count,
+                'rating_sum': total,
+                'rating_mean': total / count if count else None,
+                'histogram': histogram,
+            }
+            if row:
+                updates.append({'item_id': item_id, **values})
+            else:
+                inserts.append({'itemId': item_id, **values})
+        if updates:
+            db.execute(
+                update(table).where(
+                    table.c.itemId == bindparam('item_id')
+                ),
+                updates,
+            )
+        if inserts:
+            found = set(db.execute(
+                select(models.RatingItem.id).where(
+                    models.RatingItem.id.in_(
+                        [row['itemId'] for row in inserts]
+                    )
+                )
+            ).scalars())
+            missing.update(
+                row['itemId'] for row in inserts if row['itemId'] not in found
+            )
+            inserts = [row for row in inserts if row['itemId'] in found]
+        if inserts:
+            db.execute(insert(table), inserts)
+    return missing
+
+
+def _bump_ratings_version(db: Session, user_id: int):
+    # Runs in the rating write's transaction, so a reader never sees the
+    # new version without the rows it covers
+    table = models.User.__table__
+    db.execute(
+        update(table).where(table.c.id == user_id).values(
+            ratings_version=table.c.ratings_version + 1
+        )
+    )
+
+
+def get_ratings_version(db: Session, user_id: int) -> int | None:
+    return db.execute(
+        select(models.User.ratings_version).where(models.User.id == user_id)
+    ).scalar()
+
+
+def get_item_version(db: Session, item_id: int):
+    """(version, time_created) of an item, or None without aggregates.
+
+    Ids of deleted items can be handed out again with versions starting
+    over, the creation time tells the two items apart.
+    """
+    return db.execute(
+        select(
+            models.RatingItemStats.version, models.RatingItem.time_created
+        ).join(
+            models.RatingItem,
+            models.RatingItem.id == models.RatingItemStats.itemId,
+        ).where(
+            models.RatingItemStats.itemId == item_id
+        )
+    ).first()
 
 
 def create_rating_item(db: Session,
@@ -50,6 +261,10 @@ def create_rating_item(db: Session,
             userId=user_id,
             **data,
         )
+        # Start the aggregates at zero so later ratings only ever update
+        rating_item.stats = models.RatingItemStats(
+            rating_count=0, rating_sum=0, histogram={}
+        )
         db.add(rating_item)
         db.commit()
     except IntegrityError:
@@ -60,18 +275,282 @@ def create_rating_item(db: Session,
 
 def create_rating(db: Session,
                   user_id: int,
-                  data: dict) -> models.Rating | None:
+                  data: dict) -> schemas.RatingSuccess | None:
     try:
         rating = models.Rating(
             userId=user_id,
             **data,
         )
         db.add(rating)
+        db.flush()
+        if _update_item_stats(
+            db, {rating.itemId: Counter({rating.rating: 1})}
+        ):
+            # No such item
+            db.rollback()
+            return None
+        _bump_ratings_version(db, user_id)
+        result = schemas.RatingSuccess.from_orm(rating)
         db.commit()
     except IntegrityError:
+        db.rollback()
         return None
-    db.refresh(rating)
-    return rating
+    return result
+
+
+def _rating_with_item(user_id: int,
+                      item_data: dict,
+                      rating_data: dict) -> models.Rating:
+    value = rating_data['rating']
+    item = models.RatingItem(userId=user_id, **item_data)
+    item.stats = models.RatingItemStats(
+        rating_count=1,
+        rating_sum=value,
+        rating_mean=value,
+        histogram={str(value): 1},
+    )
+    return models.Rating(userId=user_id, item=item, **rating_data)
+
+
+def create_rating_with_item(db: Session,
+                            user_id: int,
+                            item_data: dict,
+                            rating_data: dict) -> schemas.RatingSuccess | None:
+    """Create an item together with its first rating as one unit of work.
+
+    A single flush inserts the item, its aggregates and the rating, with
+    generated ids coming back through RETURNING (lastrowid on SQLite), and
+    a single commit makes them durable together, so a failure can no
+    longer leave an item without its rating. The result is read before
+    the commit expires it, saving the refresh round trip.
+    """
+    rating = _rating_with_item(user_id, item_data, rating_data)
+    db.add(rating)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        return None
+    _bump_ratings_version(db, user_id)
+    result = schemas.RatingSuccess.from_orm(rating)
+    db.commit()
+    return result
+
+
+def create_ratings(db: Session,
+                   entries: list[tuple[int, dict | None, dict]]
+                   ) -> list[schemas.RatingSuccess | None]:
+    """Create ratings for any number of users in a single transaction, as
+    the write-behind queue's group commit.
+
+    Entries are (user_id, item_data, rating_data), with item_data None
+    when rating_data names an existing item, otherwise the item is
+    created too. Each entry's result is what create_rating or
+    create_rating_with_item would have returned for it. Ratings a user
+    already has are found up front. Any other constraint violation, or a
+    rating for an item that does not exist, rolls the batch back and the
+    entries are then retried one by one.
+    """
+    pairs = list({
+        (user_id, rating_data['itemId'])
+        for user_id, item_data, rating_data in entries
+        if item_data is None
+    })
+    taken = set()
+    for chunk in _chunks(pairs):
+        taken.update(db.execute(
+            select(models.Rating.userId, models.Rating.itemId).where(
+                tuple_(models.Rating.userId, models.Rating.itemId).in_(chunk)
+            )
+        ).all())
+
+    ratings = {}
+    changes = defaultdict(Counter)
+    for index, (user_id, item_data, rating_data) in enumerate(entries):
+        if item_data is not None:
+            ratings[index] = _rating_with_item(user_id, item_data, rating_data)
+            continue
+        pair = (user_id, rating_data['itemId'])
+        if pair in taken:
+            continue
+        taken.add(pair)
+        ratings[index] = models.Rating(userId=user_id, **rating_data)
+        changes[rating_data['itemId']][rating_data['rating']] += 1
+    db.add_all(ratings.values())
+    try:
+        db.flush()
+        failed = bool(_update_item_stats(db, changes))
+    except IntegrityError:
+        failed = True
+    if failed:
+        db.rollback()
+        return [
+            None if index not in ratings
+            else create_rating(db, user_id, rating_data) if item_data is None
+            else create_rating_with_item(db, user_id, item_data, rating_data)
+            for index, (user_id, item_data, rating_data) in enumerate(entries)
+        ]
+    for user_id in sorted({ratings[index].userId for index in ratings}):
+        _bump_ratings_version(db, user_id)
+    results = [
+        schemas.RatingSuccess.from_orm(ratings[index])
+        if index in ratings else None
+        for index in range(len(entries))
+    ]
+    db.commit()
+    return results
+
+
+def _insert_items(db: Session, rows: list[dict]) -> list[int]:
+    """Insert rating_items rows a chunk at a time and return their ids in
+    order. Rows must all have the same keys."""
+    table = models.RatingItem.__table__
+    sqlite = db.get_bind().dialect.name == 'sqlite'
+    ids = []
+    for chunk in _chunks(rows):
+        if not sqlite:
+            ids.extend(db.execute(
+                insert(table).values(chunk).returning(table.c.id)
+            ).scalars())
+            continue
+        # No RETURNING here, but SQLite numbers new rows on from the
+        # largest id and the write lock is held from the first insert, so
+        # the chunk's ids run up to the largest one in order
+        db.execute(insert(table), chunk)
+        last = db.execute(select(func.max(table.c.id))).scalar()
+        ids.extend(range(last - len(chunk) + 1, last + 1))
+    return ids
+
+
+def bulk_create_ratings(db: Session,
+                        user_id: int,
+                        entries: list[dict]) -> list[dict]:
+    """Create many ratings in a single transaction.
+
+    Entries with an itemId rate an existing item, the others create the
+    item as well. Rows that would break the unique_user_item or latitude
+    and longitude constraints are reported in their result instead of
+    aborting the batch. New items and ratings are inserted with one
+    statement per chunk and the whole batch is committed once. Should a
+    concurrent write still break a constraint, the batch is rolled back
+    and its rows are created one by one.
+    """
+    results = [{'index': index} for index in range(len(entries))]
+    item_ids = list({e['itemId'] for e in entries if 'itemId' in e})
+    found, rated = set(), set()
+    for chunk in _chunks(item_ids):
+        found.update(db.execute(
+            select(models.RatingItem.id).where(
+                models.RatingItem.id.in_(chunk)
+            )
+        ).scalars())
+        rated.update(db.execute(
+            select(models.Rating.itemId).where(
+                models.Rating.userId == user_id,
+                models.Rating.itemId.in_(chunk),
+            )
+        ).scalars())
+
+    pending, new_items = [], []
+    for index, entry in enumerate(entries):
+        entry = dict(entry)
+        if 'itemId' in entry:
+            if entry['itemId'] not in found:
+                results[index]['error'] = 'Item not found.'
+                continue
+            if entry['itemId'] in rated:
+                results[index]['error'] = (
+                    'User already has a rating for this item.'
+                )
+                continue
+            rated.add(entry['itemId'])
+            pending.append((index, entry))
+        else:
+            rating = {
+                'rating': entry.pop('rating'),
+                'description': entry.pop('description', None),
+            }
+            if (entry.get('latitude') is None) != (
+                    entry.get('longitude') is None):
+                results[index]['error'] = (
+                    'Incomplete latitude and longitude provided.'
+                )
+                continue
+            item = dict.fromkeys(schemas.RatingItemBase.__fields__)
+            new_items.append((index, {**item, **entry}, rating))
+
+    try:
+        item_ids = _insert_items(db, [
+            {'userId': user_id, **item} for _, item, _ in new_items
+        ])
+        for (index, _, rating), item_id in zip(new_items, item_ids):
+            pending.append((index, {**rating, 'itemId': item_id}))
+        pending.sort(key=lambda pair: pair[0])
+
+        changes = defaultdict(Counter)
+        for chunk in _chunks(pending):
+            db.execute(
+                insert(models.Rating),
+                [{'userId': user_id, **values} for _, values in chunk],
+            )
+            # executemany gives no ids back, fetch them by the unique pair
+            ids = dict(db.execute(
+                select(models.Rating.itemId, models.Rating.id).where(
+                    models.Rating.userId == user_id,
+                    models.Rating.itemId.in_(
+                        [values['itemId'] for _, values in chunk]
+                    ),
+                )
+            ).all())
+            for index, values in chunk:
+                results[index]['itemId'] = values['itemId']
+                results[index]['id'] = ids[values['itemId']]
+                changes[values['itemId']][values['rating']] += 1
+        # An item deleted since the check above
+        failed = bool(_update_item_stats(db, changes))
+    except IntegrityError:
+        failed = True
+    if failed:
+        db.rollback()
+        return _bulk_create_one_by_one(db, user_id, entries, results)
+    if changes:
+        _bump_ratings_version(db, user_id)
+    db.commit()
+    return results
+
+
+def _bulk_create_one_by_one(db: Session,
+                            user_id: int,
+                            entries: list[dict],
+                            results: list[dict]) -> list[dict]:
+    # Rows that failed the checks keep their error, the rest are retried
+    # and each committed on its own like a single POST /ratings
+    for index, entry in enumerate(entries):
+        result = results[index]
+        if 'error' in result:
+            continue
+        result.pop('id', None)
+        result.pop('itemId', None)
+        entry = dict(entry)
+        if 'itemId' in entry:
+            created = create_rating(db, user_id, entry)
+            if created is None and not get_rating_item(db, entry['itemId']):
+                error = 'Item not found.'
+            else:
+                error = 'User already has a rating for this item.'
+        else:
+            rating = {
+                'rating': entry.pop('rating'),
+                'description': entry.pop('description', None),
+            }
+            created = create_rating_with_item(db, user_id, entry, rating)
+            error = 'Item could not be created.'
+        if created is None:
+            result['error'] = error
+        else:
+            result['id'] = created.id
+            result['itemId'] = created.itemId
+    return results
 
 
 def delete_rating(db: Session, user_id, rating_id) -> bool:
@@ -85,26 +564,53 @@ def delete_rating(db: Session, user_id, rating_id) -> bool:
         return False
     else:
         db.delete(rating)
+        db.flush()
+        _update_item_stats(db, {rating.itemId: Counter({rating.rating: -1})})
+        _bump_ratings_version(db, user_id)
         db.commit()
         return True
 
 
-def get_user_ratings(db: Session, user_id: int) -> schemas.Rating:
-    query = select(
-        models.Rating,
-        models.RatingItem.title
+def user_ratings_query(user_id: int, fields: list[str] | None = None):
+    return select(
+        *_columns(RATING_FIELDS, fields)
+        ).select_from(
+            models.Rating
         ).join(
-            models.Rating.itemId,
+            models.RatingItem,
             models.Rating.itemId == models.RatingItem.id
         ).where(
             models.Rating.userId == user_id
+        ).order_by(
+            models.Rating.id
         )
-    result = db.execute(query).all()
 
-    # This line takes the joined query results and converts the
-    # row tuples into a new dictionary adding the key of 'title'
-    results_list = [{**x[0].__dict__, 'title': x[1]} for x in result]
-    return results_list
+
+def get_user_ratings(db: Session,
+                     user_id: int,
+                     limit: int | None = None,
+                     cursor: int | None = None,
+                     fields: list[str] | None = None) -> list[dict]:
+    query = user_ratings_query(user_id, fields)
+    if cursor is not None:
+        query = query.where(models.Rating.id > cursor)
+    if limit is not None:
+        query = query.limit(limit)
+
+    # Only the selected columns are fetched, straight into plain dicts
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+def iter_user_ratings(db: Session,
+                      user_id: int,
+                      batch_size: int = 1000):
+    """Yield all of a user's ratings in lists of at most batch_size rows,
+    fetching from a server side cursor as they are consumed."""
+    result = db.execute(
+        user_ratings_query(user_id).execution_options(stream_results=True)
+    )
+    for rows in result.mappings().partitions(batch_size):
+        yield [dict(row) for row in rows]
 
 
 def get_rating_item(db: Session, item_id: int):
@@ -114,22 +620,215 @@ def get_rating_item(db: Session, item_id: int):
 
 
 def delete_rating_item(db: Session, user_id, item_id) -> bool:
-    item = db.query(models.RatingItem).filter(
-        models.RatingItem.id == item_id
-    ).first()
-    if not item:
+    """Delete an item if user_id owns it and nobody else has rated it.
+
+    The owner and the authors of at most two of its ratings come back in
+    one query, which is all it takes to decide. The owner's own rating,
+    if any, goes with the item.
+    """
+    rows = db.execute(
+        select(models.RatingItem.userId, models.Rating.userId).outerjoin(
+            models.Rating, models.Rating.itemId == models.RatingItem.id
+        ).where(
+            models.RatingItem.id == item_id
+        ).limit(2)
+    ).all()
+    if not rows or rows[0][0] != user_id:
         return False
-    elif item.userId != user_id:
+    raters = [rater for _, rater in rows if rater is not None]
+    if len(raters) > 1 or (raters and raters[0] != user_id):
         return False
-    else:
-        ratings = db.query(models.Rating).filter(
-            models.Rating.itemId == item.id
-        ).all()
-        if len(ratings) > 1:
-            return False
-        elif ratings and ratings[0].userId != user_id:
-            return False
-        else:
-            db.delete(item)
-            db.commit()
-            return True
+    if raters:
+        db.execute(
+            delete(models.Rating.__table__).where(
+                models.Rating.itemId == item_id
+            )
+        )
+        _bump_ratings_version(db, user_id)
+    db.execute(
+        delete(models.ItemNeighbor.__table__).where(
+            or_(
+                models.ItemNeighbor.itemId == item_id,
+                models.ItemNeighbor.neighborId == item_id,
+            )
+        )
+    )
+    db.execute(
+        delete(models.RatingItemStats.__table__).where(
+            models.RatingItemStats.itemId == item_id
+        )
+    )
+    db.execute(
+        delete(models.RatingItem.__table__).where(
+            models.RatingItem.id == item_id
+        )
+    )
+    db.commit()
+    return True
+
+
+def get_top_items(db: Session,
+                  limit: int,
+                  category: str | None = None,
+                  min_count: int = 1) -> list[models.RatingItem]:
+    query = db.query(models.RatingItem).join(
+        models.RatingItemStats,
+        models.RatingItemStats.itemId == models.RatingItem.id,
+    ).filter(
+        models.RatingItemStats.rating_count >= min_count
+    )
+    if category is not None:
+        query = query.filter(models.RatingItem.category == category)
+    return query.order_by(
+        models.RatingItemStats.rating_mean.desc(),
+        models.RatingItemStats.rating_count.desc(),
+    ).limit(limit).all()
+
+
+def get_recommendations(db: Session,
+                        user_id: int,
+                        limit: int) -> list[tuple[models.RatingItem, float]]:
+    """Items the user has not rated, scored by their similarity to the
+    items the user has, each weighted by how far its rating is from
+    NEUTRAL_RATING. Reads the user's ratings joined to the precomputed
+    item_neighbors, then the winning items, two queries in all.
+    """
+    rows = db.execute(
+        select(
+            models.Rating.itemId,
+            models.Rating.rating,
+            models.ItemNeighbor.neighborId,
+            models.ItemNeighbor.score,
+        ).outerjoin(
+            models.ItemNeighbor,
+            models.ItemNeighbor.itemId == models.Rating.itemId,
+        ).where(
+            models.Rating.userId == user_id
+        )
+    ).all()
+    rated = set()
+    scores = defaultdict(float)
+    for item_id, rating, neighbor_id, similarity in rows:
+        rated.add(item_id)
+        if neighbor_id is not None:
+            scores[neighbor_id] += similarity * (rating - NEUTRAL_RATING)
+    best = heapq.nlargest(limit, (
+        (score, item_id) for item_id, score in scores.items()
+        if score > 0 and item_id not in rated
+    ))
+    if not best:
+        return []
+    items = {
+        item.id: item for item in db.query(models.RatingItem).filter(
+            models.RatingItem.id.in_([item_id for _, item_id in best])
+        )
+    }
+    return [
+        (items[item_id], score) for score, item_id in best
+        if item_id in items
+    ]
+
+
+def get_nearby_items(db: Session,
+                     latitude: float,
+                     longitude: float,
+                     radius_km: float,
+                     category: str | None = None,
+                     limit: int = 20,
+                     offset: int = 0) -> list[tuple[models.RatingItem, float]]:
+    """Items within radius_km of a point, nearest first, with distances.
+
+    Candidates come from one (geo_band, longitude) index range per band
+    of the bounding box. Only their coordinates are fetched to compute
+    exact distances, full rows are loaded for the requested page alone.
+    """
+    bands, lng_ranges = geo.bounding_box(latitude, longitude, radius_km)
+    query = select(
+        models.RatingItem.id,
+        models.RatingItem.latitude,
+        models.RatingItem.longitude,
+    ).where(
+        models.RatingItem.geo_band.in_(bands),
+        or_(*(
+            models.RatingItem.longitude.between(low, high)
+            for low, high in lng_ranges
+        )),
+    )
+    if category is not None:
+        query = query.where(models.RatingItem.category == category)
+
+    candidates = (
+        (geo.haversine(latitude, longitude, lat, lng), item_id)
+        for item_id, lat, lng in db.execute(query)
+    )
+    nearest = heapq.nsmallest(
+        offset + limit,
+        (c for c in candidates if c[0] <= radius_km),
+    )[offset:]
+    items = {
+        item.id: item
+        for item in db.query(models.RatingItem).filter(
+            models.RatingItem.id.in_([item_id for _, item_id in nearest])
+        )
+    }
+    return [(items[item_id], distance) for distance, item_id in nearest]
+
+
+def search_items(db: Session,
+                 q: str,
+                 limit: int = 20,
+                 offset: int = 0) -> list[tuple[models.RatingItem, float]]:
+    """Items whose title, address or ratings match every word of q as a
+    prefix, best match first, with their rank."""
+    words = search.terms(q)
+    if not words:
+        return []
+    query, match = search.match_query(db.get_bind().dialect.name, words)
+    hits = db.execute(
+        query, {'query': match, 'limit': limit, 'offset': offset}
+    ).all()
+    items = {
+        item.id: item
+        for item in db.query(models.RatingItem).filter(
+            models.RatingItem.id.in_([item_id for item_id, _ in hits])
+        )
+    }
+    return [
+        (items[item_id], rank) for item_id, rank in hits if item_id in items
+    ]
+
+
+def rebuild_item_stats(db: Session) -> int:
+    """Recompute every item's aggregates from the ratings table, dropping
+    aggregate rows left behind for ids that name no item."""
+    table = models.RatingItemStats.__table__
+    db.execute(
+        delete(table).where(
+            table.c.itemId.not_in(select(models.RatingItem.id))
+        )
+    )
+    # Zeroed in place rather than deleted so the version counters keep
+    # counting up and etags handed out earlier cannot match again
+    db.execute(
+        update(table).values(
+            rating_count=0, rating_sum=0, rating_mean=None, histogram={}
+        )
+    )
+    changes = {
+        item_id: Counter()
+        for item_id in db.execute(select(models.RatingItem.id)).scalars()
+    }
+    counts = db.execute(
+        select(
+            models.Rating.itemId,
+            models.Rating.rating,
+            func.count(),
+        ).group_by(models.Rating.itemId, models.Rating.rating)
+    )
+    for item_id, value, count in counts:
+        # Ratings of items that no longer exist count for nothing
+        if item_id in changes:
+            changes[item_id][value] = count
+    _update_item_stats(db, changes)
+    db.commit()
+    return len(changes)
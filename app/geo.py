@@ -0,0 +1,56 @@
+"""Geospatial helpers for ratings app.
+
+Items are bucketed into latitude bands of BAND_DEGREES. An index on
+(geo_band, longitude) turns a bounding box into one longitude range seek
+per band, exact distances are then computed with the haversine formula.
+"""
+
+import math
+
+
+EARTH_RADIUS_KM = 6371.0088
+BAND_DEGREES = 0.1
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def band(latitude: float) -> int:
+    return math.floor((latitude + 90) / BAND_DEGREES)
+
+
+def band_default(context) -> int | None:
+    """Column default computing geo_band from the inserted latitude."""
+    latitude = context.get_current_parameters().get('latitude')
+    return None if latitude is None else band(latitude)
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great circle distance in kilometres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float):
+    """Return (bands, longitude ranges) covering a circle, splitting the
+    longitude range where it crosses the antimeridian."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+    bands = list(range(band(min_lat), band(max_lat) + 1))
+
+    # Longitude degrees shrink towards the poles, widen to the worst case
+    widest = max(abs(min_lat), abs(max_lat))
+    cos_lat = math.cos(math.radians(widest))
+    lng_delta = radius_km / (KM_PER_DEGREE * max(cos_lat, 1e-12))
+    if lng_delta >= 180:
+        return bands, [(-180.0, 180.0)]
+    min_lng = longitude - lng_delta
+    max_lng = longitude + lng_delta
+    if min_lng < -180:
+        return bands, [(min_lng + 360, 180.0), (-180.0, max_lng)]
+    if max_lng > 180:
+        return bands, [(min_lng, 180.0), (-180.0, max_lng - 360)]
+    return bands, [(min_lng, max_lng)]
@@ -1,19 +1,81 @@
 """Routes and logic for ratings app back end API."""
 
-from fastapi import Depends, FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
+import json
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import (
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas, auth
-from .db import SessionLocal, engine
+from . import (
+    async_crud,
+    crud,
+    models,
+    schemas,
+    auth,
+    cache,
+    metrics,
+    serialize,
+    writes,
+)
+from .db import (
+    AsyncReadSessionLocal,
+    AsyncSessionLocal,
+    DEV_MODE,
+    ReadSessionLocal,
+    SessionLocal,
+    USE_ASYNC_DB,
+    engine,
+)
+
+
+def create_tables():
+    with engine.begin() as connection:
+        # Migrated databases are left to alembic, create_all would add the
+        # newer tables but not the newer columns and then fail the upgrade
+        if not inspect(connection).has_table('alembic_version'):
+            models.Base.metadata.create_all(bind=connection)
+
 
+if DEV_MODE:
+    create_tables()
 
-models.Base.metadata.create_all(bind=engine)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+MAX_BULK_SIZE = 10000
+MAX_NEARBY_RADIUS_KM = 100
+
+# Response keys for the list endpoints when RATINGS_FAST_JSON is on
+USER_KEYS = serialize.field_list(schemas.User)
+RATING_KEYS = serialize.field_list(schemas.Rating)
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await rating_writer.close()
+    auth.shutdown_hash_pool()
 
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -21,68 +83,289 @@ def get_db():
         db.close()
 
 
-def auth_required(db: Session = Depends(get_db),
-                  email: str = Depends(auth.get_current_user)):
-    auth_user = crud.get_user_by_email(db, email=email)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if USE_ASYNC_DB else get_sync_db
+
+
+@asynccontextmanager
+async def session_scope(read: bool = False):
+    """Session for work that outlives the request's own, such as a
+    streamed response body. Read sessions go to the replica if set."""
+    if USE_ASYNC_DB:
+        factory = AsyncReadSessionLocal if read else AsyncSessionLocal
+        async with factory() as db:
+            yield db
+    else:
+        db = (ReadSessionLocal if read else SessionLocal)()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def auth_required(claims: dict = Depends(auth.get_token_claims)):
+    if 'uid' in claims:
+        # Tokens carry the user, so no lookup is needed to trust them
+        return schemas.User(
+            id=claims['uid'], email=claims['sub'],
+            username=claims['username'],
+        )
+    # Tokens issued before the user was embedded in them
+    email = claims['sub']
+    key = email.lower()
+    auth_user = cache.user_cache.get(key)
+    if auth_user is None:
+        metrics.allow_statements(1)
+        async with session_scope() as db:
+            db_user = await async_crud.get_user_by_email(db, email=email)
+        if db_user is None:
+            return None
+        # Cache a detached snapshot, not the session-bound ORM object
+        auth_user = schemas.User.from_orm(db_user)
+        cache.user_cache.set(key, auth_user)
     return auth_user
 
 
+async def flush_ratings(entries: list) -> list:
+    async with session_scope() as db:
+        return await async_crud.create_ratings(db, entries)
+
+
+# Used by POST /ratings when RATINGS_WRITE_BEHIND is set
+rating_writer = writes.BatchWriter(flush_ratings)
+
+
+def wrote_recently(user: schemas.User | None) -> bool:
+    return user is not None and cache.recent_writers.get(user.id) is not None
+
+
+async def writer_required(user: schemas.User = Depends(auth_required)):
+    # Remember the write so this user's next reads see it
+    if user is not None:
+        cache.recent_writers.set(user.id, True)
+    return user
+
+
+async def get_read_db(user: schemas.User = Depends(auth_required)):
+    # Users who just wrote keep reading from the primary until the
+    # replica has had time to catch up
+    async with session_scope(read=not wrote_recently(user)) as db:
+        yield db
+
+
+def parse_fields(fields: str | None, available: dict) -> list[str] | None:
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Unknown fields: {", ".join(unknown)}',
+        )
+    return names
+
+
+def page_headers(rows: list[dict], limit: int) -> dict:
+    # A full page means there may be more, hand back where to resume
+    if len(rows) == limit:
+        return {'X-Next-Cursor': str(rows[-1]['id'])}
+    return {}
+
+
+def page_response(rows: list[dict],
+                  limit: int,
+                  fields: list[str] | None,
+                  response: Response,
+                  keys: tuple[str, ...]):
+    headers = page_headers(rows, limit)
+    if serialize.FAST_JSON:
+        return Response(
+            content=serialize.dump_rows(rows, None if fields else keys),
+            media_type='application/json',
+            headers=headers,
+        )
+    if fields:
+        # Partial rows would fail the response model, send them as is
+        return JSONResponse(content=rows, headers=headers)
+    response.headers.update(headers)
+    return rows
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison
+    return any(
+        tag.strip() in ('*', etag, 'W/' + etag) for tag in header.split(',')
+    )
+
+
+def item_etag_prefix(item_id: int) -> str:
+    return f'"item-{item_id}-'
+
+
+async def conditional_response(request: Request, etag: str, build):
+    """Answer a GET with a 304 if the client already holds ``etag``, else
+    with the cached body, awaiting ``build()`` for a (body, headers) pair
+    to cache on a miss."""
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={'ETag': etag},
+        )
+    entry = cache.response_cache.get(etag)
+    if entry is None:
+        entry = await build()
+        cache.response_cache.set(etag, entry)
+    body, headers = entry
+    return Response(
+        content=body,
+        media_type='application/json',
+        headers={**headers, 'ETag': etag},
+    )
+
+
+def render_json(content) -> bytes:
+    # Same encoding as the responses FastAPI builds from response models
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
 @app.get('/status')
-def check_status(db: Session = Depends(get_db),
-                 user: models.User = Depends(auth_required)):
+@metrics.query_budget(0)
+async def check_status(db: Session = Depends(get_db),
+                       user: schemas.User = Depends(auth_required)):
     return JSONResponse(status_code=200, content={'message': 'Auth Confirmed'})
 
 
+@app.get('/metrics', include_in_schema=False)
+@metrics.query_budget(0)
+async def read_metrics():
+    caches = {
+        'user': cache.user_cache,
+        'recent_writers': cache.recent_writers,
+        'response': cache.response_cache,
+        'token': auth.token_cache,
+    }
+    return PlainTextResponse(
+        metrics.render(caches), media_type=metrics.CONTENT_TYPE
+    )
+
+
 @app.post('/users', response_model=schemas.User, status_code=201)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_email = crud.get_user_by_email(db, email=user.email)
-    if db_email:
+@metrics.query_budget(2)
+async def create_user(user: schemas.UserCreate,
+                      db: Session = Depends(get_db)):
+    taken = await async_crud.get_taken_user_fields(
+        db, email=user.email, username=user.username
+    )
+    if 'email' in taken:
         raise HTTPException(status_code=400, detail='Email already in use.')
-    db_user = crud.get_user_by_username(db, username=user.username)
-    if db_user:
+    if 'username' in taken:
         raise HTTPException(status_code=400, detail='Username already in use.')
-    return crud.create_user(db=db, user=user)
+    return await async_crud.create_user(db=db, user=user)
 
 
 @app.get('/users', response_model=list[schemas.User])
-def read_users(db: Session = Depends(get_db),
-               user: models.User = Depends(auth_required)):
-    users = crud.get_users(db)
-    return users
+@metrics.query_budget(1)
+async def read_users(response: Response,
+                     limit: int = Query(DEFAULT_PAGE_SIZE,
+                                        ge=1, le=MAX_PAGE_SIZE),
+                     cursor: int | None = None,
+                     fields: str | None = None,
+                     db: Session = Depends(get_read_db),
+                     user: schemas.User = Depends(auth_required)):
+    fields = parse_fields(fields, crud.USER_FIELDS)
+    users = await async_crud.get_users(db, limit, cursor, fields)
+    return page_response(users, limit, fields, response, USER_KEYS)
 
 
 @app.post('/token')
-def login(user: schemas.UserValidate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+@metrics.query_budget(2)
+async def login(user: schemas.UserValidate, db: Session = Depends(get_db)):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Email or password incorrect',
             headers={"WWW-Authenticate": "Bearer"},
         )
-    auth_user = auth.authenticate_user(user, db_user.password_hash)
-    if not auth_user:
+    verified, new_hash = await auth.verify_password_async(
+        user.password, db_user.password_hash
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Email or password incorrect',
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Hash settings changed since this one was made, upgrade it now
+        await async_crud.update_password_hash(db, db_user, new_hash)
     access_token = auth.create_access_token(
-        data={"sub": db_user.email}
+        data={
+            "sub": db_user.email,
+            "uid": db_user.id,
+            "username": db_user.username,
+        }
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@app.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+@metrics.query_budget(0)
+async def logout(claims: dict = Depends(auth.get_token_claims)):
+    auth.revocation.revoke_token(claims['token_key'], claims['exp'])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.post('/users/me/password', status_code=status.HTTP_204_NO_CONTENT)
+@metrics.query_budget(2)
+async def change_password(data: schemas.PasswordChange,
+                          db: Session = Depends(get_db),
+                          user: schemas.User = Depends(auth_required)):
+    if user is None:
+        raise HTTPException(status_code=404, detail='User not found.')
+    db_user = await async_crud.get_user(db, user_id=user.id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail='User not found.')
+    verified, _ = await auth.verify_password_async(
+        data.current_password, db_user.password_hash
+    )
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Password incorrect',
+        )
+    password_hash = await auth.hash_password_async(data.new_password)
+    await async_crud.update_password_hash(db, db_user, password_hash)
+    # Every token issued before the change stops working
+    auth.revocation.revoke_user(user.id, user.email, time.time())
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @app.post('/ratings', response_model=schemas.RatingSuccess, status_code=201)
-def post_rating(data: schemas.RatingBase | schemas.CreateRatingItem,
-                db: Session = Depends(get_db),
-                user: models.User = Depends(auth_required)):
-    print(data)
+@metrics.query_budget(4)
+async def post_rating(data: schemas.RatingBase | schemas.CreateRatingItem,
+                      db: Session = Depends(get_db),
+                      user: schemas.User = Depends(writer_required)):
     if isinstance(data, schemas.RatingBase):
         data = data.dict()
-        rating = crud.create_rating(db, user.id, data)
+        if writes.WRITE_BEHIND:
+            rating = await rating_writer.submit((user.id, None, data))
+        else:
+            rating = await async_crud.create_rating(db, user.id, data)
 
         if not rating:
+            if not await async_crud.get_rating_item(db, data['itemId']):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail='Item not found.'
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='User already has a rating for this item.'
@@ -91,26 +374,23 @@ def post_rating(data: schemas.RatingBase | schemas.CreateRatingItem,
         return rating
     elif isinstance(data, schemas.CreateRatingItem):
         data = data.dict()
-        rating = data.pop('rating')
-        desc = data.pop('description', None)
-        rating_item = crud.create_rating_item(db, user.id, data)
+        rating_data = {
+            'rating': data.pop('rating'),
+            'description': data.pop('description', None),
+        }
+        if writes.WRITE_BEHIND:
+            rating = await rating_writer.submit((user.id, data, rating_data))
+        else:
+            rating = await async_crud.create_rating_with_item(
+                db, user.id, data, rating_data
+            )
 
-        if not rating_item:
+        if not rating:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Incomplete latitude and longitude provided.'
             )
 
-        rating_data = {
-            'rating': rating,
-            'itemId': rating_item.id
-        }
-        if desc:
-            rating_data['description'] = desc
-        rating = crud.create_rating(db, user.id, rating_data)
-        # Possible nondeterministic error occurring here
-        # Saving this print statement in case it occurs again
-        print(rating, rating_data)
         return rating
     else:
         raise HTTPException(
@@ -119,19 +399,79 @@ def post_rating(data: schemas.RatingBase | schemas.CreateRatingItem,
         )
 
 
+@app.post('/ratings/bulk', response_model=list[schemas.BulkRatingResult])
+@metrics.query_budget(allow_repeats=True)
+async def post_ratings_bulk(
+        data: list[schemas.RatingBase | schemas.CreateRatingItem],
+        db: Session = Depends(get_db),
+        user: schemas.User = Depends(writer_required)):
+    if len(data) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'At most {MAX_BULK_SIZE} ratings per request.',
+        )
+    return await async_crud.bulk_create_ratings(
+        db, user.id, [entry.dict() for entry in data]
+    )
+
+
 @app.get('/ratings', response_model=list[schemas.Rating])
-def get_ratings(db: Session = Depends(get_db),
-                user: models.User = Depends(auth_required)):
-    results = crud.get_user_ratings(db, user.id)
-    print(results)
-    return results
+@metrics.query_budget(2)
+async def get_ratings(request: Request,
+                      response: Response,
+                      limit: int = Query(DEFAULT_PAGE_SIZE,
+                                         ge=1, le=MAX_PAGE_SIZE),
+                      cursor: int | None = None,
+                      fields: str | None = None,
+                      db: Session = Depends(get_read_db),
+                      user: schemas.User = Depends(auth_required)):
+    fields = parse_fields(fields, crud.RATING_FIELDS)
+    version = await async_crud.get_ratings_version(db, user.id)
+    if version is None:
+        results = await async_crud.get_user_ratings(
+            db, user.id, limit, cursor, fields
+        )
+        return page_response(
+            results, limit, fields, response, RATING_KEYS
+        )
+
+    async def build():
+        rows = await async_crud.get_user_ratings(
+            db, user.id, limit, cursor, fields
+        )
+        if serialize.FAST_JSON:
+            body = serialize.dump_rows(rows, None if fields else RATING_KEYS)
+        else:
+            body = render_json(rows if fields else [
+                schemas.Rating.parse_obj(row) for row in rows
+            ])
+        return body, page_headers(rows, limit)
+
+    etag = '"ratings-{}-{}-{}-{}-{}"'.format(
+        user.id, version, limit, cursor, '.'.join(fields or ())
+    )
+    return await conditional_response(request, etag, build)
+
+
+@app.get('/ratings/export')
+@metrics.query_budget(1)
+async def export_ratings(user: schemas.User = Depends(auth_required)):
+    async def lines():
+        async with session_scope(read=not wrote_recently(user)) as db:
+            async for rows in async_crud.stream_user_ratings(
+                db, user.id, EXPORT_BATCH_SIZE
+            ):
+                yield ''.join(json.dumps(row) + '\n' for row in rows)
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
 
 
 @app.delete('/ratings/{rating_id}', status_code=status.HTTP_202_ACCEPTED)
-def delete_rating(rating_id: int,
-                  db: Session = Depends(get_db),
-                  user: models.User = Depends(auth_required)):
-    deleted = crud.delete_rating(db, user.id, rating_id)
+@metrics.query_budget(5)
+async def delete_rating(rating_id: int,
+                        db: Session = Depends(get_db),
+                        user: schemas.User = Depends(writer_required)):
+    deleted = await async_crud.delete_rating(db, user.id, rating_id)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -141,26 +481,101 @@ def delete_rating(rating_id: int,
 
 
 @app.get('/item/{item_id}', response_model=schemas.RatingItem)
-def get_item_detail(item_id: int,
-                    db: Session = Depends(get_db),
-                    user: models.User = Depends(auth_required)):
-    result = crud.get_rating_item(db, item_id)
-    if not result:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='Item not found'
-        )
-    return result
+@metrics.query_budget(2)
+async def get_item_detail(request: Request,
+                          item_id: int,
+                          db: Session = Depends(get_read_db),
+                          user: schemas.User = Depends(auth_required)):
+    async def build():
+        result = await async_crud.get_rating_item(db, item_id)
+        if not result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Item not found'
+            )
+        return render_json(schemas.RatingItem.from_orm(result)), {}
+
+    row = await async_crud.get_item_version(db, item_id)
+    if row is None:
+        # No aggregates row, the item is gone or predates them
+        body, _ = await build()
+        return Response(content=body, media_type='application/json')
+    version, created = row
+    etag = '{}{}-{}"'.format(
+        item_etag_prefix(item_id), created.strftime('%Y%m%d%H%M%S%f'),
+        version,
+    )
+    return await conditional_response(request, etag, build)
+
+
+@app.get('/items/top', response_model=list[schemas.RatingItem])
+@metrics.query_budget(1)
+async def get_top_items(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+                        category: str | None = None,
+                        min_count: int = Query(1, ge=1),
+                        db: Session = Depends(get_read_db),
+                        user: schemas.User = Depends(auth_required)):
+    return await async_crud.get_top_items(db, limit, category, min_count)
+
+
+@app.get('/items/nearby', response_model=list[schemas.NearbyItem])
+@metrics.query_budget(2)
+async def get_nearby_items(
+        lat: float = Query(..., ge=-90, le=90),
+        lng: float = Query(..., ge=-180, le=180),
+        radius: float = Query(5, gt=0, le=MAX_NEARBY_RADIUS_KM),
+        category: str | None = None,
+        limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0),
+        db: Session = Depends(get_read_db),
+        user: schemas.User = Depends(auth_required)):
+    results = await async_crud.get_nearby_items(
+        db, lat, lng, radius, category, limit, offset
+    )
+    return [
+        {**schemas.RatingItem.from_orm(item).dict(), 'distance': distance}
+        for item, distance in results
+    ]
+
+
+@app.get('/search', response_model=list[schemas.SearchResult])
+@metrics.query_budget(2)
+async def search(q: str = Query(..., min_length=1),
+                 limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                 offset: int = Query(0, ge=0),
+                 db: Session = Depends(get_read_db),
+                 user: schemas.User = Depends(auth_required)):
+    results = await async_crud.search_items(db, q, limit, offset)
+    return [
+        {**schemas.RatingItem.from_orm(item).dict(), 'rank': rank}
+        for item, rank in results
+    ]
+
+
+@app.get('/recommendations', response_model=list[schemas.Recommendation])
+@metrics.query_budget(2)
+async def get_recommendations(
+        limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+        db: Session = Depends(get_read_db),
+        user: schemas.User = Depends(auth_required)):
+    results = await async_crud.get_recommendations(db, user.id, limit)
+    return [
+        {**schemas.RatingItem.from_orm(item).dict(), 'score': score}
+        for item, score in results
+    ]
 
 
 @app.delete('/item/{item_id}', status_code=status.HTTP_202_ACCEPTED)
-def delete_rating_item(item_id: int,
-                       db: Session = Depends(get_db),
-                       user: models.User = Depends(auth_required)):
-    deleted = crud.delete_rating_item(db, user.id, item_id)
+@metrics.query_budget(6)
+async def delete_rating_item(item_id: int,
+                             db: Session = Depends(get_db),
+                             user: schemas.User = Depends(writer_required)):
+    deleted = await async_crud.delete_rating_item(db, user.id, item_id)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Not authorized'
         )
+    # Its id may be reused, the new item must not be served the old body
+    cache.response_cache.invalidate_prefix(item_etag_prefix(item_id))
     return {'message': 'Item deleted!'}
@@ -0,0 +1,352 @@
+"""Request metrics and sampled profiling for ratings app.
+
+MetricsMiddleware records every request's latency and the number and
+duration of the SQL statements it ran, counted through engine events, in
+histograms that /metrics renders in the Prometheus text format.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from sqlalchemy import event
+
+if TYPE_CHECKING:
+    import cProfile
+
+
+# Fraction of requests run under cProfile, those slower than
+# PROFILE_SLOW_MS have their profile logged and, if PROFILE_DIR is set,
+# written there as a .prof file for snakeviz or pstats
+PROFILE_SAMPLE_RATE = float(
+    os.environ.get('RATINGS_PROFILE_SAMPLE_RATE', 0)
+)
+PROFILE_SLOW_MS = float(os.environ.get('RATINGS_PROFILE_SLOW_MS', 500))
+PROFILE_DIR = os.environ.get('RATINGS_PROFILE_DIR')
+PROFILE_TOP = 25
+
+# Debug and test aid. 'warn' logs requests that run more statements than
+# their route's query_budget or the same statement N_PLUS_ONE_REPEATS
+# times, 'raise' also fails them with QueryBudgetExceeded.
+QUERY_CHECKS = os.environ.get('RATINGS_QUERY_CHECKS', '').lower()
+N_PLUS_ONE_REPEATS = int(os.environ.get('RATINGS_N_PLUS_ONE_REPEATS', 3))
+
+# Starlette appends the charset to text types
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 1000)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative histogram with one series per combination of label
+    values. Safe to observe from the event loop and the threadpool."""
+
+    def __init__(self, name: str, help: str,
+                 labels: tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per bucket counts, the last one being +Inf, then the sum
+                series = [0] * (len(self.buckets) + 2)
+                self._series[labels] = series
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = {labels: list(s) for labels, s in self._series.items()}
+        for labels, counts in sorted(series.items()):
+            pairs = [
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.labels, labels)
+            ]
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                total += count
+                le = ','.join([*pairs, f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{le}}} {total}')
+            label_text = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{self.name}_sum{label_text} {counts[-1]}')
+            lines.append(f'{self.name}_count{label_text} {total}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    value = value.replace('\\', r'\\').replace('"', r'\"')
+    return value.replace('\n', r'\n')
+
+
+request_seconds = Histogram(
+    'ratings_http_request_duration_seconds',
+    'Time from receiving a request to sending the last of the response.',
+    ('method', 'route', 'status'),
+    LATENCY_BUCKETS,
+)
+request_sql_statements = Histogram(
+    'ratings_http_request_sql_statements',
+    'SQL statements executed while handling a request.',
+    ('route',),
+    COUNT_BUCKETS,
+)
+request_sql_seconds = Histogram(
+    'ratings_http_request_sql_duration_seconds',
+    'Time spent executing SQL statements while handling a request.',
+    ('route',),
+    LATENCY_BUCKETS,
+)
+auth_seconds = Histogram(
+    'ratings_auth_duration_seconds',
+    'Time spent hashing passwords and encoding or decoding tokens.',
+    ('operation',),
+    LATENCY_BUCKETS,
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestStats:
+    __slots__ = ('sql_statements', 'sql_seconds', 'statements', 'allowance')
+
+    def __init__(self):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        # The statements themselves, only kept for the query checks
+        self.statements = [] if QUERY_CHECKS else None
+        # Statements run outside the route's own work, see allow_statements
+        self.allowance = 0
+
+
+# Set for the duration of each request. The threadpool runs functions in
+# a copy of the caller's context, so statements from sync sessions land
+# on the same object.
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    context._ratings_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = current_request.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += time.perf_counter() - context._ratings_started
+        if stats.statements is not None:
+            stats.statements.append(statement)
+
+
+def instrument_engine(engine):
+    """Count statements run on a sync engine, or an async engine's
+    sync_engine, against the request that ran them."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def allow_statements(count: int = 1):
+    """Let the current request run ``count`` statements over its route's
+    budget, for lookups shared dependencies make on a cache miss."""
+    stats = current_request.get()
+    if stats is not None:
+        stats.allowance += count
+
+
+def query_budget(statements: int | None = None,
+                 allow_repeats: bool = False):
+    """Declare the most SQL statements a route may run per request, and
+    whether it may repeat one, as batch writes do. Place it below the
+    route decorator. Only enforced when RATINGS_QUERY_CHECKS is set."""
+    def decorate(endpoint):
+        endpoint.query_budget = statements
+        endpoint.allow_repeats = allow_repeats
+        return endpoint
+    return decorate
+
+
+def check_queries(stats: RequestStats, scope: dict, route: str):
+    endpoint = scope.get('endpoint')
+    budget = getattr(endpoint, 'query_budget', None)
+    problems = []
+    allowed = None if budget is None else budget + stats.allowance
+    if allowed is not None and stats.sql_statements > allowed:
+        problems.append(
+            f'ran {stats.sql_statements} SQL statements, budget is {allowed}'
+        )
+    if not getattr(endpoint, 'allow_repeats', False):
+        for statement, count in Counter(stats.statements).items():
+            if count >= N_PLUS_ONE_REPEATS:
+                problems.append(
+                    f'ran this statement {count} times, N+1 queries?\n'
+                    f'{statement}'
+                )
+    if not problems:
+        return
+    message = f'{scope["method"]} {route} ' + '\n'.join(problems)
+    if QUERY_CHECKS == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *labels)
+
+
+# cProfile hooks the thread it is enabled on and only one profiler can
+# be active per thread, so a single request on the event loop is profiled
+# at a time. Other requests interleaving with it show up in its profile,
+# and work handed to the threadpool or hashing processes does not.
+_profiling = threading.Lock()
+
+
+def start_profile() -> cProfile.Profile | None:
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profiling.acquire(blocking=False):
+        return None
+    # The profilers are only loaded once a request is sampled
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler: cProfile.Profile,
+                   elapsed: float,
+                   method: str,
+                   route: str):
+    profiler.disable()
+    _profiling.release()
+    if elapsed * 1000 < PROFILE_SLOW_MS:
+        return
+    if PROFILE_DIR:
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        filename = f'{stamp}-{method}-{name}-{elapsed * 1000:.0f}ms.prof'
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(
+        'cumulative'
+    ).print_stats(PROFILE_TOP)
+    logger.warning('Slow request %s %s took %.0f ms\n%s',
+                   method, route, elapsed * 1000, out.getvalue())
+
+
+_route_paths = {}
+
+
+def route_label(scope: dict) -> str:
+    # The path template rather than the path, keeping one series per
+    # route whatever the ids in the URL
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return 'unmatched'
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in scope['app'].routes:
+            if getattr(route, 'endpoint', None) is endpoint:
+                path = _route_paths[endpoint] = route.path
+                break
+        else:
+            return endpoint.__name__
+    return path
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        profiler = start_profile()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = route_label(scope)
+            request_seconds.observe(
+                elapsed, scope['method'], route, str(status_code)
+            )
+            request_sql_statements.observe(stats.sql_statements, route)
+            request_sql_seconds.observe(stats.sql_seconds, route)
+            if profiler is not None:
+                finish_profile(profiler, elapsed, scope['method'], route)
+        if QUERY_CHECKS:
+            check_queries(stats, scope, route)
+
+
+def render(caches: dict) -> str:
+    """All metrics in the Prometheus text format, along with hit, miss
+    and size figures for the given {name: TTLCache} caches."""
+    lines = []
+    for histogram in (request_seconds, request_sql_statements,
+                      request_sql_seconds, auth_seconds):
+        lines.extend(histogram.render())
+    for metric, key, kind, help in [
+        ('ratings_cache_hits_total', 'hits', 'counter', 'Cache hits.'),
+        ('ratings_cache_misses_total', 'misses', 'counter', 'Cache misses.'),
+        ('ratings_cache_entries', 'size', 'gauge', 'Entries held.'),
+        ('ratings_cache_bytes', 'bytes', 'gauge',
+         'Size of the entries held, for caches bounded by it.'),
+    ]:
+        lines.append(f'# HELP {metric} {help}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, cache in caches.items():
+            stats = cache.stats()
+            if key in stats:
+                lines.append(f'{metric}{{cache="{name}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
@@ -1,5 +1,7 @@
 """Database models for ratings app."""
 
+import datetime
+
 from sqlalchemy import (
     Column,
     Integer,
@@ -7,13 +9,23 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     DateTime,
+    JSON,
     CheckConstraint,
-    UniqueConstraint
+    UniqueConstraint,
+    Index,
+    DDL,
+    event,
 )
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship  # noqa
+from sqlalchemy.orm import relationship
 
 from .db import Base
+from . import geo, search
+
+
+def utcnow() -> datetime.datetime:
+    # CURRENT_TIMESTAMP on SQLite stops at seconds, item etags need more
+    return datetime.datetime.now(datetime.timezone.utc)
 
 
 class User(Base):
@@ -25,6 +37,15 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     password_hash = Column(String)
+    # Bumped with every change to the user's ratings, for /ratings etags
+    ratings_version = Column(Integer, nullable=False, default=0,
+                             server_default='0')
+
+    # Case-insensitive lookups in crud compare on lower() to hit these
+    __table_args__ = (
+        Index('ix_users_email_lower', func.lower(email)),
+        Index('ix_users_username_lower', func.lower(username)),
+    )
 
 
 class RatingItem(Base):
@@ -38,27 +59,90 @@ class RatingItem(Base):
     address = Column(String)
     latitude = Column(Float)
     longitude = Column(Float)
-    time_created = Column(DateTime(timezone=True), server_default=func.now())
+    # Latitude band for the nearby search, see geo.py
+    geo_band = Column(Integer, default=geo.band_default)
+    time_created = Column(DateTime(timezone=True), default=utcnow,
+                          server_default=func.now())
     time_updated = Column(DateTime(timezone=True), onupdate=func.now())
 
     # ratings = relationship('Rating', back_populates='rating_items')
+    stats = relationship('RatingItemStats', uselist=False, lazy='joined')
 
-    check = CheckConstraint(
-        '''
-        (latitude IS NOT NULL AND longitude IS NOT NULL)
-        OR (latitude IS NULL AND longitude IS NULL)
-        ''')
+    __table_args__ = (
+        CheckConstraint(
+            '''
+            (latitude IS NOT NULL AND longitude IS NOT NULL)
+            OR (latitude IS NULL AND longitude IS NULL)
+            ''',
+            name='check',
+        ),
+        Index('ix_rating_items_geo', 'geo_band', 'longitude'),
+        # Items of a category in id order
+        Index('ix_rating_items_category_id', 'category', 'id'),
+    )
+
+
+@event.listens_for(RatingItem.latitude, 'set')
+def set_geo_band(target, value, oldvalue, initiator):
+    # Keep the band in step on ORM writes, Core inserts use the default
+    target.geo_band = None if value is None else geo.band(value)
 
 
 class Rating(Base):
     __tablename__ = 'ratings'
 
     id = Column(Integer, primary_key=True, index=True)
-    itemId = Column(ForeignKey('rating_items.id'), nullable=False)
+    # Indexed for deleting an item, which looks up and removes its ratings
+    itemId = Column(ForeignKey('rating_items.id'), nullable=False, index=True)
     userId = Column(ForeignKey('users.id'), nullable=False)
     rating = Column(Integer, nullable=False)
     description = Column(String)
 
     # rating_items = relationship('RatingItem', back_populates='ratings')
+    item = relationship('RatingItem')
+
+    __table_args__ = (
+        UniqueConstraint('itemId', 'userId', name='unique_user_item'),
+        # A user's ratings in id order, the /ratings pages and export
+        Index('ix_ratings_userId_id', 'userId', 'id'),
+    )
+
+
+class RatingItemStats(Base):
+    __tablename__ = 'rating_item_stats'
+
+    itemId = Column(ForeignKey('rating_items.id'), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_mean = Column(Float, index=True)
+    # Number of ratings per rating value, keyed by the value as a string
+    histogram = Column(JSON, nullable=False, default=dict)
+    # Bumped with every change to the aggregates, for /item etags
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    # The version item_neighbors was last computed at, see recommend.py
+    neighbors_version = Column(Integer)
+
+
+class ItemNeighbor(Base):
+    __tablename__ = 'item_neighbors'
+
+    itemId = Column(ForeignKey('rating_items.id'), primary_key=True)
+    neighborId = Column(ForeignKey('rating_items.id'), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    # Finds the lists an item appears in when it changes or is deleted
+    __table_args__ = (
+        Index('ix_item_neighbors_neighborId', 'neighborId'),
+    )
+
 
-    unique_user_item = UniqueConstraint('itemId', 'userId')
+# Fresh databases from create_all get the full-text index along with the
+# tables it covers, migrated ones get it from alembic
+for dialect, statements in [('sqlite', search.SQLITE_DDL),
+                            ('postgresql', search.POSTGRES_DDL)]:
+    for statement in statements:
+        event.listen(
+            Rating.__table__,
+            'after_create',
+            DDL(statement).execute_if(dialect=dialect),
+        )
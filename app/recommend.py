@@ -0,0 +1,274 @@
+"""Item to item similarities behind GET /recommendations.
+
+Items are compared by the cosine of their rating columns, every rating
+taken relative to crud.NEUTRAL_RATING, so shared likes and shared
+dislikes make two items similar and opposite opinions set them apart.
+Only each item's TOP_K most similar items are kept, in item_neighbors,
+and that table is all the request path reads.
+
+A rating only changes its own item's column, so a refresh recomputes the
+items whose aggregates version moved since their neighbors were stored
+and patches their new scores into the lists of the items they touch.
+It only loads the ratings of users who rated a changed item, all that
+the changed columns' similarities depend on, and takes every column's
+length from its item's rating histogram. A full list whose patched
+scores fall below the lowest score it held may now owe its place to an
+item it never stored, so such items are recomputed as well, and the
+result is the lists a full refresh would store.
+
+Needs numpy and scipy, which only this background job imports.
+"""
+
+import os
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import (
+    bindparam,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.orm import Session
+
+from . import models
+from .crud import NEUTRAL_RATING, _chunks
+
+
+TOP_K = int(os.environ.get('RATINGS_NEIGHBORS_TOP_K', 50))
+# Items whose similarities to every other item are computed at once
+BLOCK_SIZE = 1000
+WRITE_CHUNK_SIZE = 5000
+# Past this share of all users, reading every rating beats looking up
+# the ratings of the users who rated changed items
+FULL_LOAD_SHARE = 0.5
+
+
+def rating_matrix(user_ids: np.ndarray,
+                  item_ids: np.ndarray,
+                  ratings: np.ndarray,
+                  squares: dict[int, float] | None = None):
+    """Build the users x items matrix with unit length columns, returned
+    in CSC form along with the item id of each column. Columns are scaled
+    by the ratings given, or when only some of an item's ratings are, by
+    the sum of its squared ratings in ``squares``."""
+    columns, item_index = np.unique(item_ids, return_inverse=True)
+    _, user_index = np.unique(user_ids, return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (ratings.astype(np.float32) - NEUTRAL_RATING,
+         (user_index, item_index)),
+        shape=(user_index.max() + 1, len(columns)),
+    )
+    squared = np.asarray(matrix.multiply(matrix).sum(axis=0))[0]
+    if squares is not None:
+        squared = np.array([
+            squares.get(item_id, total)
+            for item_id, total in zip(columns.tolist(), squared.tolist())
+        ], dtype=np.float32)
+    norms = np.sqrt(squared)
+    # Columns of neutral ratings only stay zero and match nothing
+    scale = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (matrix @ sparse.diags(scale)).tocsc(), columns
+
+
+def _array(rows: list, width: int) -> np.ndarray:
+    # Flattened first, numpy probes every Row for array attributes
+    return np.fromiter(
+        chain.from_iterable(rows), dtype=np.int64
+    ).reshape(-1, width)
+
+
+def load_matrix(db: Session):
+    rows = _array(db.execute(
+        select(
+            models.Rating.userId,
+            models.Rating.itemId,
+            models.Rating.rating,
+        )
+    ).all(), 3)
+    if not len(rows):
+        return None, np.empty(0, dtype=np.int64)
+    return rating_matrix(rows[:, 0], rows[:, 1], rows[:, 2])
+
+
+def load_changed_matrix(db: Session, item_ids: list[int]):
+    """The matrix of every rating by the users who rated ``item_ids``.
+    Those items' columns are whole, the others hold enough to score them
+    against these, with lengths from their histograms."""
+    rating = models.Rating
+    users = set()
+    for chunk in _chunks(item_ids):
+        users.update(db.execute(
+            select(rating.userId).where(rating.itemId.in_(chunk))
+        ).scalars())
+    total = db.execute(
+        select(func.count()).select_from(models.User)
+    ).scalar()
+    if len(users) > total * FULL_LOAD_SHARE:
+        return load_matrix(db)
+    rows = []
+    for chunk in _chunks(list(users)):
+        rows.extend(db.execute(
+            select(rating.userId, rating.itemId, rating.rating).where(
+                rating.userId.in_(chunk)
+            )
+        ).all())
+    rows = _array(rows, 3)
+    if not len(rows):
+        return None, np.empty(0, dtype=np.int64)
+
+    stats = models.RatingItemStats
+    squares = {}
+    for chunk in _chunks(np.unique(rows[:, 1]).tolist()):
+        for item_id, histogram in db.execute(
+            select(stats.itemId, stats.histogram).where(
+                stats.itemId.in_(chunk)
+            )
+        ):
+            squares[item_id] = sum(
+                count * (int(value) - NEUTRAL_RATING) ** 2
+                for value, count in histogram.items()
+            )
+    return rating_matrix(rows[:, 0], rows[:, 1], rows[:, 2], squares)
+
+
+def similarities(matrix, columns: list[int]):
+    """Yield (column, neighbor columns, scores) for each of ``columns``,
+    with every other column it has a positive similarity to."""
+    for block in _chunks(columns, BLOCK_SIZE):
+        scores = (matrix[:, block].T @ matrix).tocsr()
+        for row, column in enumerate(block):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            neighbors = scores.indices[start:end]
+            values = scores.data[start:end]
+            keep = (values > 0) & (neighbors != column)
+            yield column, neighbors[keep], values[keep]
+
+
+def top_k(neighbors: np.ndarray, values: np.ndarray, k: int):
+    if len(values) > k:
+        best = np.argpartition(-values, k)[:k]
+        neighbors, values = neighbors[best], values[best]
+    order = np.argsort(-values, kind='stable')
+    return neighbors[order], values[order]
+
+
+def _top_lists(matrix, item_ids: np.ndarray, targets, k: int) -> dict:
+    position = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+    lists = {item_id: [] for item_id in targets}
+    columns = sorted(position[i] for i in targets if i in position)
+    for column, neighbors, values in similarities(matrix, columns):
+        best, scores = top_k(neighbors, values, k)
+        lists[int(item_ids[column])] = list(
+            zip(item_ids[best].tolist(), scores.tolist())
+        )
+    return lists
+
+
+def refresh_neighbors(db: Session,
+                      full: bool = False,
+                      k: int = TOP_K) -> int:
+    """Recompute the neighbor lists of items rated or unrated since their
+    last refresh, or of every item when ``full``, and return how many
+    items were recomputed."""
+    stats = models.RatingItemStats
+    query = select(stats.itemId, stats.version)
+    if not full:
+        query = query.where(or_(
+            stats.neighbors_version.is_(None),
+            stats.neighbors_version != stats.version,
+        ))
+    # Versions are read before the ratings, so a rating that lands in
+    # between leaves its item due for the next refresh
+    versions = dict(db.execute(query).all())
+    if not versions:
+        return 0
+
+    if full:
+        matrix, item_ids = load_matrix(db)
+    else:
+        matrix, item_ids = load_changed_matrix(db, list(versions))
+    position = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+    changed = sorted(position[i] for i in versions if i in position)
+    is_changed = np.zeros(len(item_ids), dtype=bool)
+    is_changed[changed] = True
+
+    # Items without ratings left have no neighbors
+    lists = {item_id: [] for item_id in versions}
+    patches = defaultdict(dict)
+    for column, neighbors, values in similarities(matrix, changed):
+        item_id = int(item_ids[column])
+        best, scores = top_k(neighbors, values, k)
+        lists[item_id] = list(zip(item_ids[best].tolist(), scores.tolist()))
+        if not full:
+            others = ~is_changed[neighbors]
+            for other, score in zip(item_ids[neighbors[others]].tolist(),
+                                    values[others].tolist()):
+                patches[other][item_id] = score
+
+    table = models.ItemNeighbor.__table__
+    if not full:
+        # Unchanged items that had or now have a changed item as neighbor
+        stored = defaultdict(dict)
+        lengths = defaultdict(int)
+        # The lowest score in each stored list, no neighbor left out of a
+        # full list scores higher
+        lowest = {}
+        affected = set(patches)
+        for chunk in _chunks(list(versions), WRITE_CHUNK_SIZE):
+            affected.update(db.execute(
+                select(table.c.itemId).where(table.c.neighborId.in_(chunk))
+            ).scalars())
+        affected.difference_update(versions)
+        for chunk in _chunks(list(affected), WRITE_CHUNK_SIZE):
+            for item_id, neighbor_id, score in db.execute(
+                select(table).where(table.c.itemId.in_(chunk))
+            ):
+                lengths[item_id] += 1
+                lowest[item_id] = min(lowest.get(item_id, score), score)
+                if neighbor_id not in versions:
+                    stored[item_id][neighbor_id] = score
+        recompute = []
+        for item_id in affected:
+            candidates = {**stored[item_id], **patches[item_id]}
+            neighbors = np.fromiter(candidates, dtype=np.int64)
+            values = np.fromiter(candidates.values(), dtype=np.float64)
+            best, scores = top_k(neighbors, values, k)
+            if lengths[item_id] >= k and (
+                    len(scores) < k or scores[-1] < lowest[item_id]):
+                recompute.append(item_id)
+            else:
+                lists[item_id] = list(zip(best.tolist(), scores.tolist()))
+        if recompute:
+            matrix, item_ids = load_changed_matrix(db, recompute)
+            lists.update(_top_lists(matrix, item_ids, recompute, k))
+
+    if full:
+        db.execute(delete(table))
+    else:
+        for chunk in _chunks(list(lists), WRITE_CHUNK_SIZE):
+            db.execute(delete(table).where(table.c.itemId.in_(chunk)))
+    rows = [
+        {'itemId': item_id, 'neighborId': neighbor_id, 'score': score}
+        for item_id, neighbors in lists.items()
+        for neighbor_id, score in neighbors
+    ]
+    for chunk in _chunks(rows, WRITE_CHUNK_SIZE):
+        db.execute(insert(table), chunk)
+    stats_table = stats.__table__
+    db.execute(
+        update(stats_table).where(
+            stats_table.c.itemId == bindparam('item_id')
+        ).values(neighbors_version=bindparam('computed')),
+        [
+            {'item_id': item_id, 'computed': version}
+            for item_id, version in versions.items()
+        ],
+    )
+    db.commit()
+    return len(versions)
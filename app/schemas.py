@@ -35,8 +35,18 @@ class RatingItemBase(BaseModel):
 
     image: str | None = None
     address: str | None = None
-    latitude: int | None = None
-    longitude: int | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+
+    class Config:
+        orm_mode = True
+
+
+class ItemStats(BaseModel):
+    rating_count: int
+    rating_sum: int
+    rating_mean: float | None = None
+    histogram: dict[int, int]
 
     class Config:
         orm_mode = True
@@ -47,6 +57,19 @@ class RatingItem(RatingItemBase):
     userId: int
     time_created: datetime.datetime
     time_updated: datetime.date | None = None
+    stats: ItemStats | None = None
+
+
+class NearbyItem(RatingItem):
+    distance: float
+
+
+class SearchResult(RatingItem):
+    rank: float
+
+
+class Recommendation(RatingItem):
+    score: float
 
 
 class RatingBase(BaseModel):
@@ -77,10 +100,18 @@ class CreateRatingItem(RatingItemBase):
     description: str | None = None
 
 
+class BulkRatingResult(BaseModel):
+    index: int
+    id: int | None = None
+    itemId: int | None = None
+    error: str | None = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 
-class TokenData(BaseModel):
-    email: str | None = None
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
@@ -0,0 +1,126 @@
+"""Full-text search over item titles, addresses and rating descriptions.
+
+On SQLite the text lives in two external content FTS5 tables kept in
+sync by triggers, on Postgres in GIN indexes over to_tsvector expressions.
+Both match every query term as a prefix and rank items by their best
+matching item or rating text, higher ranks being better matches.
+"""
+
+import re
+
+from sqlalchemy import text
+
+
+SQLITE_DDL = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS rating_items_fts USING fts5(
+        title, address,
+        content='rating_items', content_rowid='id', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_insert
+    AFTER INSERT ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rowid, title, address)
+        VALUES (new.id, new.title, new.address);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_delete
+    AFTER DELETE ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rating_items_fts, rowid, title, address)
+        VALUES ('delete', old.id, old.title, old.address);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS rating_items_fts_update
+    AFTER UPDATE OF title, address ON rating_items BEGIN
+        INSERT INTO rating_items_fts(rating_items_fts, rowid, title, address)
+        VALUES ('delete', old.id, old.title, old.address);
+        INSERT INTO rating_items_fts(rowid, title, address)
+        VALUES (new.id, new.title, new.address);
+    END
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ratings_fts USING fts5(
+        description,
+        content='ratings', content_rowid='id', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_insert
+    AFTER INSERT ON ratings BEGIN
+        INSERT INTO ratings_fts(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_delete
+    AFTER DELETE ON ratings BEGIN
+        INSERT INTO ratings_fts(ratings_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ratings_fts_update
+    AFTER UPDATE OF description ON ratings BEGIN
+        INSERT INTO ratings_fts(ratings_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO ratings_fts(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+]
+
+# Must match the expressions indexed on Postgres
+POSTGRES_ITEM_VECTOR = (
+    "to_tsvector('simple', title || ' ' || coalesce(address, ''))"
+)
+POSTGRES_RATING_VECTOR = "to_tsvector('simple', coalesce(description, ''))"
+
+# Same indexes as the migration adding search
+POSTGRES_DDL = [
+    'CREATE INDEX IF NOT EXISTS ix_rating_items_search ON rating_items '
+    f'USING gin ({POSTGRES_ITEM_VECTOR})',
+    'CREATE INDEX IF NOT EXISTS ix_ratings_search ON ratings '
+    f'USING gin ({POSTGRES_RATING_VECTOR})',
+]
+
+SQLITE_QUERY = text('''
+    SELECT item_id, -MIN(rank) AS rank FROM (
+        SELECT rowid AS item_id, bm25(rating_items_fts) AS rank
+        FROM rating_items_fts WHERE rating_items_fts MATCH :query
+        UNION ALL
+        SELECT ratings."itemId", bm25(ratings_fts)
+        FROM ratings_fts JOIN ratings ON ratings.id = ratings_fts.rowid
+        WHERE ratings_fts MATCH :query
+    ) AS hits
+    GROUP BY item_id ORDER BY rank DESC, item_id
+    LIMIT :limit OFFSET :offset
+''')
+
+POSTGRES_QUERY = text(f'''
+    SELECT item_id, MAX(rank) AS rank FROM (
+        SELECT id AS item_id, ts_rank({POSTGRES_ITEM_VECTOR}, query) AS rank
+        FROM rating_items, to_tsquery('simple', :query) AS query
+        WHERE {POSTGRES_ITEM_VECTOR} @@ query
+        UNION ALL
+        SELECT "itemId", ts_rank({POSTGRES_RATING_VECTOR}, query)
+        FROM ratings, to_tsquery('simple', :query) AS query
+        WHERE {POSTGRES_RATING_VECTOR} @@ query
+    ) AS hits
+    GROUP BY item_id ORDER BY rank DESC, item_id
+    LIMIT :limit OFFSET :offset
+''')
+
+
+def terms(q: str) -> list[str]:
+    # Plain words only, so user input can never be read as query syntax
+    return re.findall(r'\w+', q.lower())
+
+
+def match_query(dialect: str, words: list[str]):
+    """Return the dialect's search statement and its query string."""
+    if dialect == 'postgresql':
+        return POSTGRES_QUERY, ' & '.join(f'{word}:*' for word in words)
+    return SQLITE_QUERY, ' '.join(f'"{word}"*' for word in words)
@@ -0,0 +1,124 @@
+"""Write-behind queue for rating creation in ratings app.
+
+With RATINGS_WRITE_BEHIND set, POST /ratings hands its insert to a queue
+instead of committing on its own. A single writer task takes whatever
+has queued up, up to WRITE_BATCH_SIZE entries, and commits them together,
+so on SQLite one write lock and one commit cover many requests. Each
+request still waits for the commit that includes its rating.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+
+
+WRITE_BEHIND = os.environ.get(
+    'RATINGS_WRITE_BEHIND', ''
+).lower() in ('1', 'true', 'yes')
+WRITE_BATCH_SIZE = int(os.environ.get('RATINGS_WRITE_BATCH_SIZE', 100))
+# How long the writer waits for a batch to fill once it has one entry,
+# requests arriving during a commit are batched without waiting
+WRITE_BATCH_DELAY_MS = float(
+    os.environ.get('RATINGS_WRITE_BATCH_DELAY_MS', 2)
+)
+# Requests wait to enqueue once this many entries are pending
+WRITE_QUEUE_SIZE = int(os.environ.get('RATINGS_WRITE_QUEUE_SIZE', 10000))
+
+logger = logging.getLogger(__name__)
+
+# Queued by close, the writer exits once it reaches it
+_STOP = object()
+
+
+class BatchWriter:
+    """Queue whose entries are passed in batches to ``flush``, an async
+    function returning one result per entry, with each ``submit`` call
+    resolving to its own entry's result.
+
+    The writer task starts on the first submit and is bound to that
+    event loop, a submit from another loop starts a new one.
+    """
+
+    def __init__(self, flush, batch_size: int = WRITE_BATCH_SIZE,
+                 batch_delay: float = WRITE_BATCH_DELAY_MS / 1000,
+                 queue_size: int = WRITE_QUEUE_SIZE):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue_size = queue_size
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(self.queue_size)
+        # A fresh context keeps the batches' SQL statements from being
+        # counted against the request that happened to start the task
+        self._task = loop.create_task(
+            self._run(), context=contextvars.Context()
+        )
+
+    async def submit(self, entry):
+        self._start()
+        future = self._loop.create_future()
+        await self._queue.put((entry, future))
+        return await future
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.batch_delay
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list):
+        try:
+            results = await self.flush([entry for entry, _ in batch])
+        except Exception as exc:
+            logger.exception('Write-behind batch of %d failed', len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            # Cancelled when the client went away, the write still stands
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                await self._write(batch)
+            if stop:
+                return
+
+    async def close(self):
+        """Write what is already queued, then stop the writer task."""
+        if self._task is None or self._task.done():
+            return
+        if self._loop is not asyncio.get_running_loop():
+            # Started on a loop that has since gone, along with its queue
+            self._task = None
+            return
+        await self._queue.put(_STOP)
+        await self._task
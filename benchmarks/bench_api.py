@@ -0,0 +1,374 @@
+"""Load test the API end to end and compare runs across commits.
+
+Seeds a database, drives the app either in process through httpx's ASGI
+transport or through uvicorn with several workers, and reports throughput
+and p50/p95/p99 latency per endpoint. Results are saved as JSON so runs
+on different commits can be compared.
+
+Usage:
+    python -m benchmarks.bench_api run [--mode uvicorn --workers 4]
+        [--users N --items N --ratings N] [--output results.json]
+    python -m benchmarks.bench_api compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+PASSWORD = 'benchmark-password'
+SEED_CHUNK = 5000
+ENDPOINTS = (
+    'POST /token',
+    'GET /ratings',
+    'POST /ratings',
+    'GET /item/{id}',
+    'GET /users',
+)
+
+
+def seed(url: str, users: int, items: int, ratings: int, rng: random.Random):
+    """Fill an empty database through Core inserts and return the seeded
+    users as (id, email, username) tuples."""
+    from sqlalchemy import create_engine, insert
+
+    from app import auth, crud, models
+    from app.db import SessionLocal
+
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    # One hash for everyone, logins still pay for a full verification
+    password_hash = auth.hash_password(PASSWORD)
+    seeded = [
+        (i + 1, f'bench{i}@example.com', f'bench{i}') for i in range(users)
+    ]
+    per_user = min(ratings // max(users, 1), items)
+    with engine.begin() as conn:
+        for start in range(0, users, SEED_CHUNK):
+            conn.execute(insert(models.User), [
+                {'email': email, 'username': username,
+                 'password_hash': password_hash}
+                for _, email, username in seeded[start:start + SEED_CHUNK]
+            ])
+        for start in range(0, items, SEED_CHUNK):
+            conn.execute(insert(models.RatingItem), [
+                {
+                    'userId': rng.randint(1, users),
+                    'category': rng.choice(('food', 'drink', 'place')),
+                    'title': f'Item {i}',
+                    'latitude': rng.uniform(-60, 60),
+                    'longitude': rng.uniform(-180, 180),
+                }
+                for i in range(start, min(start + SEED_CHUNK, items))
+            ])
+        # User u rates items u+1 .. u+per_user, so every pair is unique
+        rows = (
+            {
+                'userId': user_id,
+                'itemId': (user_id + offset) % items + 1,
+                'rating': rng.randint(1, 5),
+            }
+            for user_id, _, _ in seeded for offset in range(per_user)
+        )
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == SEED_CHUNK:
+                conn.execute(insert(models.Rating), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.Rating), batch)
+    engine.dispose()
+
+    with SessionLocal() as db:
+        crud.rebuild_item_stats(db)
+    return seeded
+
+
+def tokens_for(seeded: list, count: int, rng: random.Random) -> list[dict]:
+    from app import auth
+
+    return [
+        {'Authorization': 'Bearer ' + auth.create_access_token(data={
+            'sub': email, 'uid': user_id, 'username': username,
+        })}
+        for user_id, email, username in rng.sample(seeded, count)
+    ]
+
+
+def scenarios(seeded: list, items: int, rng: random.Random) -> dict:
+    """A function per endpoint returning the next request to send."""
+    headers = tokens_for(seeded, min(len(seeded), 100), rng)
+    created = iter(range(10 ** 9))
+
+    def login():
+        _, email, _ = rng.choice(seeded)
+        return 'POST', '/token', {
+            'json': {'email': email, 'password': PASSWORD},
+        }
+
+    def list_ratings():
+        return 'GET', '/ratings', {'headers': rng.choice(headers)}
+
+    def post_rating():
+        return 'POST', '/ratings', {
+            'headers': rng.choice(headers),
+            'json': {
+                'category': 'bench',
+                'title': f'Created {next(created)}',
+                'rating': rng.randint(1, 5),
+            },
+        }
+
+    def item_detail():
+        return 'GET', f'/item/{rng.randint(1, items)}', {
+            'headers': rng.choice(headers),
+        }
+
+    def list_users():
+        return 'GET', '/users', {
+            'headers': rng.choice(headers),
+            'params': {'cursor': rng.randint(0, len(seeded))},
+        }
+
+    return dict(zip(ENDPOINTS, (
+        login, list_ratings, post_rating, item_detail, list_users,
+    )))
+
+
+async def drive(client: httpx.AsyncClient,
+                make_request,
+                requests: int,
+                concurrency: int) -> dict:
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / elapsed,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p50_ms': cuts[49] * 1000,
+        'p95_ms': cuts[94] * 1000,
+        'p99_ms': cuts[98] * 1000,
+    }
+
+
+async def run_all(client: httpx.AsyncClient, args, plans: dict) -> dict:
+    results = {}
+    for endpoint in args.endpoints:
+        requests = (
+            args.token_requests if endpoint == 'POST /token' else args.requests
+        )
+        # Warm caches, pools and the hashing processes before measuring
+        await drive(client, plans[endpoint], args.concurrency, 1)
+        results[endpoint] = await drive(
+            client, plans[endpoint], requests, args.concurrency
+        )
+        report(endpoint, results[endpoint])
+    return results
+
+
+def report(endpoint: str, result: dict):
+    print(f'{endpoint:16} {result["throughput"]:9.1f} req/s  '
+          f'p50 {result["p50_ms"]:8.2f}  p95 {result["p95_ms"]:8.2f}  '
+          f'p99 {result["p99_ms"]:8.2f} ms  {result["errors"]} errors')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get('/status')
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run_in_process(args, plans: dict) -> dict:
+    from app import auth
+    from app.main import app
+
+    try:
+        async with httpx.AsyncClient(
+                app=app, base_url='http://bench') as client:
+            return await run_all(client, args, plans)
+    finally:
+        auth.shutdown_hash_pool()
+
+
+async def run_uvicorn(args, plans: dict) -> dict:
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, '-m', 'uvicorn', 'app.main:app',
+        '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(args.workers), '--log-level', 'warning',
+    ], env=os.environ.copy())
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+                base_url=f'http://127.0.0.1:{port}',
+                limits=limits,
+                timeout=60) as client:
+            await wait_until_up(client)
+            return await run_all(client, args, plans)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'bench.db')
+        if os.path.exists(path):
+            raise SystemExit(f'{path} exists, benchmarks seed a new database')
+        # Picked up by app.db on import, and by the uvicorn workers
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        os.environ['ASYNC_DATABASE_URL'] = f'sqlite+aiosqlite:///{path}'
+
+        started = time.perf_counter()
+        seeded = seed(os.environ['DATABASE_URL'],
+                      args.users, args.items, args.ratings, rng)
+        print(f'seeded {args.users} users, {args.items} items and '
+              f'{args.ratings} ratings in '
+              f'{time.perf_counter() - started:.1f}s')
+
+        plans = scenarios(seeded, args.items, rng)
+        runner = run_uvicorn if args.mode == 'uvicorn' else run_in_process
+        results = asyncio.run(runner(args, plans))
+
+    output = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'settings': {
+            'mode': args.mode,
+            'workers': args.workers if args.mode == 'uvicorn' else 1,
+            'users': args.users,
+            'items': args.items,
+            'ratings': args.ratings,
+            'concurrency': args.concurrency,
+            'env': {
+                key: value for key, value in os.environ.items()
+                if key.startswith('RATINGS_')
+            },
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f'saved results to {args.output}')
+
+
+def compare(args):
+    """Print each endpoint's change between two saved runs and exit
+    non-zero if any got slower than the threshold allows."""
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before['settings'] != after['settings']:
+        print('warning: the runs used different settings')
+    regressed = False
+    for endpoint, new in after['results'].items():
+        old = before['results'].get(endpoint)
+        if old is None:
+            continue
+        changes = []
+        for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+            change = (new[key] - old[key]) / old[key] * 100
+            # Less throughput or more latency is worse
+            worse = -change if key == 'throughput' else change
+            flag = '!' if worse > args.threshold else ' '
+            regressed = regressed or worse > args.threshold
+            changes.append(f'{key} {change:+6.1f}%{flag}')
+        print(f'{endpoint:16} ' + '  '.join(changes))
+    if regressed:
+        raise SystemExit(
+            f'regression: worse by more than {args.threshold}% somewhere'
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_api')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    bench = commands.add_parser('run', help='seed a database and load test')
+    bench.add_argument('--mode', choices=('asgi', 'uvicorn'), default='asgi',
+                       help='drive the app in process or through uvicorn')
+    bench.add_argument('--workers', type=int, default=4,
+                       help='uvicorn worker processes')
+    bench.add_argument('--users', type=int, default=1000)
+    bench.add_argument('--items', type=int, default=5000)
+    bench.add_argument('--ratings', type=int, default=20000)
+    bench.add_argument('--requests', type=int, default=1000,
+                       help='requests per endpoint')
+    bench.add_argument('--token-requests', type=int, default=100,
+                       help='requests to POST /token, which hashes')
+    bench.add_argument('--concurrency', type=int, default=16)
+    bench.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS),
+                       choices=ENDPOINTS, metavar='ENDPOINT')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--db', help='database file to create and seed, '
+                       'a temporary one by default')
+    bench.add_argument('--output', help='where to save the JSON results')
+    bench.set_defaults(func=run)
+
+    diff = commands.add_parser('compare', help='compare two saved runs')
+    diff.add_argument('before')
+    diff.add_argument('after')
+    diff.add_argument('--threshold', type=float, default=10,
+                      help='percent change that counts as a regression')
+    diff.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
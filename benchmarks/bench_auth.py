@@ -0,0 +1,61 @@
+"""Benchmark authenticated request throughput on GET /status for a token
+that needs a user lookup, and for stateless tokens with and without the
+verified token cache.
+
+Usage: python -m benchmarks.bench_auth [requests]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+async def run(app, token: str, requests: int) -> float:
+    headers = {'Authorization': f'Bearer {token}'}
+    async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+        response = await client.get('/status', headers=headers)
+        assert response.status_code == 200, response.text
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get('/status', headers=headers)
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault(
+            'DATABASE_URL', f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        )
+        from app import auth, cache, crud, schemas
+        from app.db import SessionLocal
+        from app.main import app
+
+        with SessionLocal() as db:
+            user = crud.create_user(db, schemas.UserCreate(
+                email='bench@example.com', username='bench', password='x',
+            ), hashed_password='x')
+        legacy = auth.create_access_token(data={'sub': user.email})
+        stateless = auth.create_access_token(data={
+            'sub': user.email, 'uid': user.id, 'username': user.username,
+        })
+
+        cases = [
+            ('user lookup (cached)', legacy, auth.TOKEN_CACHE_SIZE),
+            ('stateless, no cache', stateless, 0),
+            ('stateless, cached', stateless, auth.TOKEN_CACHE_SIZE),
+        ]
+        for name, token, cache_size in cases:
+            auth.token_cache = cache.TTLCache(
+                maxsize=cache_size, ttl=auth.token_cache.ttl
+            )
+            rate = asyncio.run(run(app, token, requests))
+            print(f'{name:22} {rate:8.0f} req/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark SQLite read/write throughput under concurrency with the
+default rollback journal settings and with the pragmas from app.db.
+
+Usage: python -m benchmarks.bench_db_concurrency [threads] [seconds]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.exc import OperationalError
+
+from app import db, models
+
+
+def run(engine, threads: int, seconds: float, write_ratio: float) -> dict:
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        local = {'reads': 0, 'writes': 0, 'errors': 0}
+        while time.perf_counter() < deadline:
+            try:
+                if rng.random() < write_ratio:
+                    with engine.begin() as conn:
+                        conn.execute(insert(models.Rating), {
+                            'itemId': rng.randrange(1, 1000),
+                            'userId': 1,
+                            'rating': rng.randrange(1, 6),
+                        })
+                    local['writes'] += 1
+                else:
+                    with engine.connect() as conn:
+                        conn.execute(
+                            select(models.Rating.id).where(
+                                models.Rating.itemId == rng.randrange(1, 1000)
+                            ).limit(20)
+                        ).all()
+                    local['reads'] += 1
+            except OperationalError:
+                local['errors'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(i,))
+               for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for name, tuned in [('before (defaults)', False),
+                        ('after (pragmas)', True)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+            engine = create_engine(url, **db.engine_options(url))
+            if tuned:
+                event.listen(engine, 'connect', db.apply_sqlite_pragmas)
+            models.Base.metadata.create_all(bind=engine)
+            for write_ratio in (0.1, 0.5):
+                result = run(engine, threads, seconds, write_ratio)
+                print(f'{name:18} writes={write_ratio:.0%}: '
+                      f'{result["reads"]:8.0f} reads/s '
+                      f'{result["writes"]:7.0f} writes/s '
+                      f'{result["errors"]:5.0f} errors/s')
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
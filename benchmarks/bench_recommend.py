@@ -0,0 +1,137 @@
+"""Benchmark refreshing item neighbors and serving recommendations.
+
+Seeds a database with synthetic ratings, times a full refresh, then an
+incremental one after a batch of new ratings, then get_recommendations
+for a sample of users.
+
+Usage:
+    python -m benchmarks.bench_recommend [--users N --items N
+        --ratings N --new-ratings N --db path]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+SEED_CHUNK = 5000
+
+
+def seed(url: str, users: int, items: int, ratings: int,
+         rng: random.Random):
+    from sqlalchemy import create_engine, insert
+
+    from app import models
+
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for start in range(0, users, SEED_CHUNK):
+            conn.execute(insert(models.User), [
+                {'email': f'bench{i}@example.com', 'username': f'bench{i}',
+                 'password_hash': 'x'}
+                for i in range(start, min(start + SEED_CHUNK, users))
+            ])
+        for start in range(0, items, SEED_CHUNK):
+            conn.execute(insert(models.RatingItem), [
+                {'userId': 1, 'category': 'bench', 'title': f'Item {i}'}
+                for i in range(start, min(start + SEED_CHUNK, items))
+            ])
+        # Skewed towards popular items, like real ratings
+        pairs = set()
+        while len(pairs) < ratings:
+            pairs.add((
+                rng.randint(1, users),
+                min(int(rng.paretovariate(1.2)), items),
+            ))
+        batch = []
+        for user_id, item_id in pairs:
+            batch.append({'userId': user_id, 'itemId': item_id,
+                          'rating': rng.randint(1, 5)})
+            if len(batch) == SEED_CHUNK:
+                conn.execute(insert(models.Rating), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.Rating), batch)
+    engine.dispose()
+
+
+def add_ratings(db, users: int, items: int, count: int,
+                rng: random.Random):
+    from app import crud, models
+
+    taken = set(db.query(models.Rating.userId, models.Rating.itemId))
+    added = 0
+    while added < count:
+        user_id, item_id = rng.randint(1, users), rng.randint(1, items)
+        if (user_id, item_id) in taken:
+            continue
+        taken.add((user_id, item_id))
+        crud.create_rating(db, user_id, {
+            'itemId': item_id, 'rating': rng.randint(1, 5),
+        })
+        added += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.bench_recommend'
+    )
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--ratings', type=int, default=1_000_000)
+    parser.add_argument('--new-ratings', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='database file to create and seed, '
+                        'a temporary one by default')
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'bench.db')
+        if os.path.exists(path):
+            raise SystemExit(f'{path} exists, benchmarks seed a new database')
+        # Picked up by app.db on import
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+        started = time.perf_counter()
+        seed(os.environ['DATABASE_URL'],
+             args.users, args.items, args.ratings, rng)
+        print(f'seeded {args.ratings} ratings in '
+              f'{time.perf_counter() - started:.1f}s')
+
+        from app import crud, recommend
+        from app.db import SessionLocal
+
+        with SessionLocal() as db:
+            crud.rebuild_item_stats(db)
+
+            started = time.perf_counter()
+            count = recommend.refresh_neighbors(db, full=True)
+            print(f'full refresh of {count} items: '
+                  f'{time.perf_counter() - started:.2f}s')
+
+            add_ratings(db, args.users, args.items, args.new_ratings, rng)
+            started = time.perf_counter()
+            count = recommend.refresh_neighbors(db)
+            print(f'incremental refresh after {args.new_ratings} ratings, '
+                  f'{count} items: {time.perf_counter() - started:.2f}s')
+
+            latencies = []
+            for _ in range(args.lookups):
+                user_id = rng.randint(1, args.users)
+                started = time.perf_counter()
+                crud.get_recommendations(db, user_id, 20)
+                latencies.append(time.perf_counter() - started)
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+            print(f'get_recommendations: p50 {cuts[49] * 1000:.2f} ms  '
+                  f'p95 {cuts[94] * 1000:.2f} ms  '
+                  f'p99 {cuts[98] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
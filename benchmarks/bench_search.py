@@ -0,0 +1,93 @@
+"""Benchmark full-text search against a naive LIKE '%q%' scan.
+
+Usage: python -m benchmarks.bench_search [items] [queries]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app import crud, models
+
+
+WORDS = [
+    'pizza', 'taco', 'noodle', 'burger', 'sushi', 'bakery', 'coffee',
+    'harbour', 'island', 'garden', 'market', 'corner', 'golden', 'little',
+    'crispy', 'smoky', 'spicy', 'fresh', 'street', 'avenue', 'north',
+    'south', 'river', 'park', 'house', 'kitchen', 'grill', 'bistro',
+]
+
+
+def phrase(rng: random.Random, length: int) -> str:
+    return ' '.join(rng.choice(WORDS) + str(rng.randrange(500))
+                    for _ in range(length))
+
+
+def seed(engine, items: int):
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(0)
+    batch = 20000
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {'email': 'bench@example.com', 'username': 'bench'},
+        ])
+        for start in range(0, items, batch):
+            ids = range(start + 1, min(start + batch, items) + 1)
+            conn.execute(insert(models.RatingItem), [
+                {
+                    'id': item_id, 'userId': 1, 'category': 'food',
+                    'title': phrase(rng, 3), 'address': phrase(rng, 2),
+                }
+                for item_id in ids
+            ])
+            conn.execute(insert(models.Rating), [
+                {
+                    'itemId': item_id, 'userId': 1, 'rating': 3,
+                    'description': phrase(rng, 8),
+                }
+                for item_id in ids
+            ])
+
+
+def naive_search(db: Session, q: str, limit: int) -> list:
+    pattern = f'%{q}%'
+    rated = select(models.Rating.itemId).where(
+        models.Rating.description.like(pattern)
+    )
+    return db.query(models.RatingItem).filter(or_(
+        models.RatingItem.title.like(pattern),
+        models.RatingItem.address.like(pattern),
+        models.RatingItem.id.in_(rated),
+    )).limit(limit).all()
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "bench.db")}')
+        start = time.perf_counter()
+        seed(engine, items)
+        print(f'seeded {items} items and ratings in '
+              f'{time.perf_counter() - start:.1f}s')
+
+        rng = random.Random(1)
+        terms = [rng.choice(WORDS) + str(rng.randrange(500))
+                 for _ in range(queries)]
+        with Session(engine) as db:
+            for name, fn in [('fts', crud.search_items),
+                             ('LIKE scan', naive_search)]:
+                start = time.perf_counter()
+                for q in terms:
+                    fn(db, q, 20)
+                elapsed = (time.perf_counter() - start) / queries
+                print(f'{name:10} {elapsed * 1000:9.3f} ms/query')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark encoding list responses through the response model against
+the RATINGS_FAST_JSON path, checking both give the same bytes.
+
+Usage: python -m benchmarks.bench_serialize [repeats]
+"""
+
+import asyncio
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import schemas, serialize
+
+
+SIZES = (10, 100, 1000, 10_000, 100_000)
+
+
+def rating_rows(count: int) -> list[dict]:
+    # Same keys and key order as crud.get_user_ratings
+    return [
+        {
+            'id': i,
+            'rating': i % 5 + 1,
+            'itemId': i * 7,
+            'userId': 1,
+            'description': None if i % 3 else f'Très "bon"\n#{i} ✨',
+            'title': f'Item {i}',
+        }
+        for i in range(count)
+    ]
+
+
+def user_rows(count: int) -> list[dict]:
+    # Same keys and key order as crud.get_users
+    return [
+        {
+            'id': i,
+            'email': f'user{i}@example.com',
+            'username': f'user{i}',
+            'first_name': None if i % 2 else 'Zoë',
+            'last_name': None,
+        }
+        for i in range(count)
+    ]
+
+
+async def model_path(field, rows: list[dict]) -> bytes:
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content=content).body
+
+
+def best_of(repeats: int, fn) -> tuple[float, bytes]:
+    best, body = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, body
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    encoder = 'orjson' if serialize.orjson is not None else 'json'
+    loop = asyncio.new_event_loop()
+    print(f'fast path encoder: {encoder}')
+    for schema, make_rows in [(schemas.Rating, rating_rows),
+                              (schemas.User, user_rows)]:
+        field = create_response_field(name='response', type_=list[schema])
+        keys = serialize.field_list(schema)
+        for size in SIZES:
+            rows = make_rows(size)
+            model, expected = best_of(
+                repeats,
+                lambda: loop.run_until_complete(model_path(field, rows)),
+            )
+            fast, body = best_of(
+                repeats, lambda: serialize.dump_rows(rows, keys)
+            )
+            assert body == expected, f'{schema.__name__} output differs'
+            print(f'{schema.__name__:7} {size:7} rows: '
+                  f'model {model * 1000:9.2f} ms  '
+                  f'fast {fast * 1000:8.2f} ms  '
+                  f'{model / fast:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
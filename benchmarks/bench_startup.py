@@ -0,0 +1,126 @@
+"""Measure cold start: the import time of app.main, and the time from
+launching a server to its first answered request.
+
+Servers are started on a new database each time, through the serve
+command, which migrates once before starting its workers, and through
+plain uvicorn, whose workers each create missing tables in development
+mode.
+
+Usage: python -m benchmarks.bench_startup [--workers N] [--repeats N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_api import free_port
+
+
+IMPORT_SCRIPT = (
+    'import time; started = time.perf_counter(); import app.main; '
+    'print(time.perf_counter() - started)'
+)
+
+
+def import_seconds(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def first_request_seconds(command: list[str], env: dict, port: int,
+                          timeout: float = 60) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        command, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                # Any answer will do, /status wants a token
+                httpx.get(f'http://127.0.0.1:{port}/status')
+                return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if time.perf_counter() - started > timeout:
+                raise SystemExit(f'no answer within {timeout}s: {command}')
+            if server.poll() is not None:
+                raise SystemExit(f'server exited: {command}')
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.bench_startup'
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def fresh_env(name: str, dev_mode: bool) -> dict:
+            path = os.path.join(tmp, f'{name}.db')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            return {
+                **os.environ,
+                'DATABASE_URL': f'sqlite:///{path}',
+                'ASYNC_DATABASE_URL': f'sqlite+aiosqlite:///{path}',
+                'RATINGS_DEV_MODE': '1' if dev_mode else '0',
+            }
+
+        imports = {
+            'development mode': [
+                import_seconds(fresh_env('import', True))
+                for _ in range(args.repeats)
+            ],
+            'production mode': [
+                import_seconds(fresh_env('import', False))
+                for _ in range(args.repeats)
+            ],
+        }
+        for name, times in imports.items():
+            print(f'import app.main, {name:16} '
+                  f'{statistics.median(times) * 1000:8.1f} ms')
+
+        for name, dev_mode, command in [
+            ('serve', False, [
+                sys.executable, '-m', 'app.cli', 'serve',
+                '--log-level', 'warning',
+            ]),
+            ('uvicorn', True, [
+                sys.executable, '-m', 'uvicorn', 'app.main:app',
+                '--log-level', 'warning',
+            ]),
+        ]:
+            new, current = [], []
+            for _ in range(args.repeats):
+                # Each new database is then started on a second time
+                env = fresh_env(name, dev_mode)
+                for times in (new, current):
+                    port = free_port()
+                    times.append(first_request_seconds([
+                        *command, '--port', str(port),
+                        '--workers', str(args.workers),
+                    ], env, port))
+            for state, times in (('new database', new),
+                                 ('up to date', current)):
+                print(f'first request, {name:7} {state:12} '
+                      f'{statistics.median(times) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
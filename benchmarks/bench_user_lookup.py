@@ -0,0 +1,67 @@
+"""Benchmark case-insensitive user lookups: ilike scan vs lower() index.
+
+Usage: python -m benchmarks.bench_user_lookup [rows] [lookups]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, insert, select
+
+from app import models
+
+
+def seed(engine, rows: int):
+    models.Base.metadata.create_all(bind=engine)
+    batch = 50000
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(insert(models.User), [
+                {
+                    'email': f'User{i}@Example.com',
+                    'username': f'User{i}',
+                    'password_hash': 'x',
+                }
+                for i in range(start, min(start + batch, rows))
+            ])
+
+
+def time_lookups(engine, condition, emails: list) -> float:
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for email in emails:
+            row = conn.execute(
+                select(models.User.id).where(condition(email))
+            ).first()
+            assert row is not None
+        return (time.perf_counter() - start) / len(emails)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "bench.db")}')
+        start = time.perf_counter()
+        seed(engine, rows)
+        print(f'seeded {rows} users in {time.perf_counter() - start:.1f}s')
+
+        step = max(rows // lookups, 1)
+        emails = [f'user{i}@example.com' for i in range(0, rows, step)]
+        ilike = time_lookups(
+            engine, lambda e: models.User.email.ilike(e), emails[:20]
+        )
+        lower = time_lookups(
+            engine,
+            lambda e: func.lower(models.User.email) == func.lower(e),
+            emails,
+        )
+        print(f'ilike scan:   {ilike * 1000:9.3f} ms/lookup')
+        print(f'lower() seek: {lower * 1000:9.3f} ms/lookup')
+        print(f'speedup:      {ilike / lower:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Check that the queries in crud use indexes.
+
+Runs the crud functions against a scratch SQLite database, records every
+statement they send and asks SQLite for its EXPLAIN QUERY PLAN. A plan
+step that reads a whole table is reported unless the check expects it,
+as when listing from the first row or rebuilding every item's
+aggregates. Walking all of a covering index reads every row just the
+same, so those steps count as full scans too. Run through
+``python -m app.cli check-query-plans`` from the repository root.
+"""
+
+import os
+import re
+import tempfile
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import crud, db, models, schemas
+
+
+# Older SQLite versions print SCAN TABLE name. A search, which seeks into
+# an index, prints SEARCH instead.
+FULL_SCAN = re.compile(
+    r'SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX \w+)?'
+)
+STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def seed(session: Session):
+    for i in range(1, 4):
+        crud.create_user(session, schemas.UserCreate(
+            email=f'user{i}@example.com', username=f'user{i}', password='-',
+        ), 'not-a-hash')
+    for i in range(1, 7):
+        crud.create_rating_with_item(session, i % 3 + 1, {
+            'category': ('food', 'drink')[i % 2],
+            'title': f'Item {i}',
+            'latitude': 40.0 + i / 100,
+            'longitude': -74.0,
+        }, {'rating': i % 5 + 1, 'description': f'Rating {i}'})
+    for item_id in range(2, 7):
+        crud.create_rating(session, 1, {'itemId': item_id, 'rating': 4})
+    session.execute(insert(models.ItemNeighbor), [
+        {'itemId': 2, 'neighborId': 1, 'score': 0.5},
+        {'itemId': 3, 'neighborId': 1, 'score': 0.25},
+    ])
+    session.commit()
+
+
+def checks(session: Session) -> list[tuple]:
+    """(label, call, tables it may scan) for each query shape crud uses."""
+    user = crud.get_user(session, 1)
+    item = {'category': 'food', 'title': 'New item'}
+    return [
+        ('get_user', lambda: crud.get_user(session, 2), ()),
+        ('get_user_by_email',
+         lambda: crud.get_user_by_email(session, 'User2@example.com'), ()),
+        ('get_user_by_username',
+         lambda: crud.get_user_by_username(session, 'User2'), ()),
+        ('get_taken_user_fields', lambda: crud.get_taken_user_fields(
+            session, 'user2@example.com', 'user3'), ()),
+        # The first page reads users in id order and stops at the limit
+        ('get_users', lambda: crud.get_users(session, 10), ('users',)),
+        ('get_users after cursor',
+         lambda: crud.get_users(session, 10, cursor=1), ()),
+        ('create_user', lambda: crud.create_user(session, schemas.UserCreate(
+            email='new@example.com', username='new', password='-',
+        ), 'not-a-hash'), ()),
+        ('update_password_hash',
+         lambda: crud.update_password_hash(session, user, 'not-a-hash'), ()),
+        ('get_ratings_version',
+         lambda: crud.get_ratings_version(session, 1), ()),
+        ('get_item_version', lambda: crud.get_item_version(session, 1), ()),
+        ('create_rating_item',
+         lambda: crud.create_rating_item(session, 1, item), ()),
+        ('create_rating', lambda: crud.create_rating(
+            session, 2, {'itemId': 2, 'rating': 3}), ()),
+        ('create_rating_with_item', lambda: crud.create_rating_with_item(
+            session, 2, item, {'rating': 3}), ()),
+        ('create_ratings', lambda: crud.create_ratings(session, [
+            (3, None, {'itemId': 2, 'rating': 5}),
+            (3, item, {'rating': 1}),
+        ]), ()),
+        ('bulk_create_ratings', lambda: crud.bulk_create_ratings(session, 2, [
+            {'itemId': 3, 'rating': 2},
+            {**item, 'rating': 4},
+        ]), ()),
+        ('get_user_ratings',
+         lambda: crud.get_user_ratings(session, 1, 10), ()),
+        ('get_user_ratings after cursor',
+         lambda: crud.get_user_ratings(session, 1, 10, cursor=2), ()),
+        ('iter_user_ratings',
+         lambda: list(crud.iter_user_ratings(session, 1)), ()),
+        ('get_rating_item', lambda: crud.get_rating_item(session, 1), ()),
+        # Walks the rating_mean index from the top, stopping at the limit
+        ('get_top_items', lambda: crud.get_top_items(session, 10),
+         ('rating_item_stats',)),
+        ('get_top_items in category',
+         lambda: crud.get_top_items(session, 10, category='food'), ()),
+        ('get_recommendations',
+         lambda: crud.get_recommendations(session, 1, 10), ()),
+        ('get_nearby_items', lambda: crud.get_nearby_items(
+            session, 40.0, -74.0, 10, category='food'), ()),
+        ('search_items', lambda: crud.search_items(session, 'item'), ()),
+        ('delete_rating', lambda: crud.delete_rating(session, 1, 7), ()),
+        ('delete_rating_item',
+         lambda: crud.delete_rating_item(session, 2, 1), ()),
+        # Recomputes every item by design
+        ('rebuild_item_stats', lambda: crud.rebuild_item_stats(session),
+         ('rating_items', 'rating_item_stats', 'ratings')),
+    ]
+
+
+def full_scans(connection, statement: str, parameters) -> set[str]:
+    plan = connection.exec_driver_sql(
+        'EXPLAIN QUERY PLAN ' + statement, parameters
+    ).all()
+    # Subqueries the plan materializes are scanned under their alias
+    return {
+        match.group(1) for *_, detail in plan
+        if (match := FULL_SCAN.fullmatch(detail))
+        and match.group(1) in models.Base.metadata.tables
+    }
+
+
+def check() -> list[str]:
+    """Run every check and return a line per unexpected full scan."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'plans.db')
+        engine = db.make_engine(f'sqlite:///{path}')
+        try:
+            models.Base.metadata.create_all(bind=engine)
+            session = sessionmaker(autoflush=False, bind=engine)()
+            seed(session)
+
+            calls = checks(session)
+            label, sent = None, []
+
+            def record(conn, cursor, statement, parameters, context,
+                       executemany):
+                if statement.lstrip().upper().startswith(STATEMENTS):
+                    if executemany:
+                        parameters = parameters[0]
+                    sent.append((label, statement, parameters))
+
+            event.listen(engine, 'before_cursor_execute', record)
+            expected = {}
+            for label, call, scans in calls:
+                expected[label] = scans
+                call()
+            event.remove(engine, 'before_cursor_execute', record)
+            session.close()
+
+            problems = []
+            with engine.connect() as connection:
+                for label, statement, parameters in sent:
+                    tables = full_scans(connection, statement, parameters)
+                    for table in sorted(tables - set(expected[label])):
+                        problems.append(
+                            f'{label}: full scan of {table}\n{statement}'
+                        )
+            return problems
+        finally:
+            engine.dispose()
+
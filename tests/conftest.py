@@ -0,0 +1,60 @@
+import itertools
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Read when app.db is imported, so set before any test module imports app
+_tmp = tempfile.mkdtemp(prefix='ratings-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{_tmp}/test.db'
+os.environ['ASYNC_DATABASE_URL'] = f'sqlite+aiosqlite:///{_tmp}/test.db'
+os.environ['RATINGS_QUERY_CHECKS'] = 'raise'
+
+_users = itertools.count()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client):
+    """Register a new user and return (user, auth headers)."""
+    def make_user(password: str = 'secret'):
+        n = next(_users)
+        user = client.post('/users', json={
+            'email': f'user{n}@example.com',
+            'username': f'user{n}',
+            'password': password,
+        }).json()
+        token = client.post('/token', json={
+            'email': user['email'], 'password': password,
+        }).json()['access_token']
+        return user, {'Authorization': f'Bearer {token}'}
+    return make_user
+
+
+@pytest.fixture
+def headers(make_user):
+    return make_user()[1]
+
+
+@pytest.fixture
+def new_item(client):
+    """Rate a new item and return the response."""
+    def new_item(headers, **fields):
+        return client.post('/ratings', headers=headers, json={
+            'category': 'food', 'title': 'Pizza', 'rating': 4, **fields,
+        })
+    return new_item
@@ -0,0 +1,60 @@
+"""Requests against every route, with RATINGS_QUERY_CHECKS=raise failing
+any that runs over its query budget or repeats a statement."""
+
+import json
+
+
+def test_every_route(client, make_user, new_item):
+    user, headers = make_user()
+    _, other = make_user()
+
+    assert client.get('/status', headers=headers).status_code == 200
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/users', headers=headers).status_code == 200
+    assert client.get(
+        '/users', headers=headers, params={'fields': 'username'}
+    ).status_code == 200
+
+    created = new_item(headers, title='Corner pizza',
+                       latitude=40.7, longitude=-74.0)
+    assert created.status_code == 201
+    item_id = created.json()['itemId']
+    rating = client.post('/ratings', headers=other, json={
+        'itemId': item_id, 'rating': 5, 'description': 'Crisp crust',
+    })
+    assert rating.status_code == 201
+    bulk = client.post('/ratings/bulk', headers=headers, json=[
+        {'category': 'drink', 'title': f'Coffee {n}', 'rating': 3}
+        for n in range(5)
+    ])
+    assert bulk.status_code == 200
+    assert all(row['error'] is None for row in bulk.json())
+
+    ratings = client.get('/ratings', headers=headers)
+    assert ratings.status_code == 200
+    assert len(ratings.json()) == 6
+    export = client.get('/ratings/export', headers=headers)
+    assert export.status_code == 200
+    assert len([json.loads(line) for line in export.text.splitlines()]) == 6
+
+    assert client.get(f'/item/{item_id}', headers=headers).json()[
+        'stats']['rating_count'] == 2
+    assert client.get('/items/top', headers=headers).status_code == 200
+    nearby = client.get('/items/nearby', headers=headers,
+                        params={'lat': 40.7, 'lng': -74.0})
+    assert item_id in [item['id'] for item in nearby.json()]
+    found = client.get('/search', headers=headers, params={'q': 'crust'})
+    assert item_id in [item['id'] for item in found.json()]
+    assert client.get('/recommendations', headers=headers).status_code == 200
+
+    assert client.delete(
+        f'/ratings/{rating.json()["id"]}', headers=other
+    ).status_code == 202
+    assert client.delete(
+        f'/item/{item_id}', headers=headers
+    ).status_code == 202
+
+    assert client.post('/users/me/password', headers=headers, json={
+        'current_password': 'secret', 'new_password': 'changed',
+    }).status_code == 204
+    assert client.post('/logout', headers=other).status_code == 204
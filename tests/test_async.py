@@ -0,0 +1,30 @@
+import asyncio
+import os
+
+from app import async_crud, crud, db
+
+
+def test_async_sessions_run_the_same_queries(client, make_user, new_item):
+    user, headers = make_user()
+    item_id = new_item(headers, title='Async pie').json()['itemId']
+
+    async def read():
+        engine = db.make_async_engine(os.environ['ASYNC_DATABASE_URL'])
+        try:
+            async with db.make_async_sessionmaker(engine)() as session:
+                found = await async_crud.get_user_by_email(
+                    session, user['email'].upper()
+                )
+                item = await async_crud.get_rating_item(session, item_id)
+                ratings = await async_crud.get_user_ratings(
+                    session, user['id'], 10
+                )
+                return found.id, item.title, ratings
+        finally:
+            await engine.dispose()
+
+    found_id, title, ratings = asyncio.run(read())
+    with db.SessionLocal() as session:
+        expected = crud.get_user_ratings(session, user['id'], 10)
+    assert (found_id, title) == (user['id'], 'Async pie')
+    assert ratings == expected
@@ -0,0 +1,55 @@
+import asyncio
+
+from app import auth
+
+
+def test_logout_revokes_only_that_token(client, make_user):
+    user, headers = make_user()
+    second = client.post('/token', json={
+        'email': user['email'], 'password': 'secret',
+    }).json()['access_token']
+
+    assert client.post('/logout', headers=headers).status_code == 204
+    assert client.get('/status', headers=headers).status_code == 401
+    assert client.get(
+        '/status', headers={'Authorization': f'Bearer {second}'}
+    ).status_code == 200
+
+
+def test_password_change_revokes_earlier_tokens(client, make_user):
+    user, headers = make_user()
+    # Issued before tokens carried the user id
+    legacy = {'Authorization': 'Bearer ' + auth.create_access_token(
+        data={'sub': user['email'].upper()}
+    )}
+    assert client.get('/ratings', headers=legacy).status_code == 200
+
+    assert client.post('/users/me/password', headers=headers, json={
+        'current_password': 'secret', 'new_password': 'changed',
+    }).status_code == 204
+    assert client.get('/status', headers=headers).status_code == 401
+    assert client.get('/ratings', headers=legacy).status_code == 401
+
+    assert client.post('/token', json={
+        'email': user['email'], 'password': 'secret',
+    }).status_code == 401
+    token = client.post('/token', json={
+        'email': user['email'], 'password': 'changed',
+    }).json()['access_token']
+    assert client.get(
+        '/status', headers={'Authorization': f'Bearer {token}'}
+    ).status_code == 200
+
+
+def test_hashing_refuses_work_when_every_slot_is_taken(client, make_user,
+                                                       monkeypatch):
+    user, _ = make_user()
+    monkeypatch.setattr(auth, '_hash_slots', asyncio.Semaphore(0))
+    for url, body in [
+        ('/token', {'email': user['email'], 'password': 'secret'}),
+        ('/users', {'email': 'busy@example.com', 'username': 'busy',
+                    'password': 'secret'}),
+    ]:
+        response = client.post(url, json=body)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(auth.HASH_RETRY_AFTER)
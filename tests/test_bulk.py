@@ -0,0 +1,71 @@
+from sqlalchemy import event, insert
+
+from app import crud, db, models
+
+
+def test_bulk_reports_each_row(client, make_user, new_item):
+    _, headers = make_user()
+    _, owner = make_user()
+    item_id = new_item(owner).json()['itemId']
+    client.post('/ratings', headers=headers,
+                json={'itemId': item_id, 'rating': 2})
+
+    results = client.post('/ratings/bulk', headers=headers, json=[
+        {'itemId': item_id, 'rating': 3},
+        {'itemId': 10 ** 9, 'rating': 3},
+        {'category': 'food', 'title': 'Half placed', 'rating': 3,
+         'latitude': 1.0},
+        {'category': 'food', 'title': 'Placed', 'rating': 3,
+         'latitude': 1.0, 'longitude': 2.0},
+    ]).json()
+    assert [row['error'] for row in results] == [
+        'User already has a rating for this item.',
+        'Item not found.',
+        'Incomplete latitude and longitude provided.',
+        None,
+    ]
+    placed = client.get(f'/item/{results[3]["itemId"]}', headers=headers)
+    assert placed.json()['title'] == 'Placed'
+
+
+def test_bulk_falls_back_per_row_on_a_concurrent_rating(client, make_user):
+    rater, _ = make_user()
+    _, headers = make_user()
+    taken, free = [
+        client.post('/ratings', headers=headers, json={
+            'category': 'food', 'title': title, 'rating': 3,
+        }).json()['itemId']
+        for title in ('Taken', 'Free')
+    ]
+
+    raced = []
+
+    def rate_first(conn, cursor, statement, *args):
+        # Another request rates the item after the duplicate check
+        if raced or not statement.startswith('INSERT'):
+            return
+        raced.append(statement)
+        with db.engine.begin() as other:
+            other.execute(insert(models.Rating.__table__), {
+                'userId': rater['id'], 'itemId': taken, 'rating': 1,
+            })
+
+    event.listen(db.engine, 'before_cursor_execute', rate_first)
+    try:
+        with db.SessionLocal() as session:
+            results = crud.bulk_create_ratings(session, rater['id'], [
+                {'itemId': taken, 'rating': 5},
+                {'itemId': free, 'rating': 4},
+                {'category': 'food', 'title': 'Brand new', 'rating': 2},
+            ])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', rate_first)
+
+    assert results[0] == {
+        'index': 0, 'error': 'User already has a rating for this item.',
+    }
+    assert results[1]['itemId'] == free and 'error' not in results[1]
+    assert results[2]['id'] is not None and 'error' not in results[2]
+    with db.SessionLocal() as session:
+        item = crud.get_rating_item(session, free)
+        assert item.stats.rating_count == 2
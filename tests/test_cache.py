@@ -0,0 +1,45 @@
+from app.cache import TTLCache
+
+
+def response_cache(maxbytes: int) -> TTLCache:
+    return TTLCache(maxsize=100, ttl=60, maxbytes=maxbytes,
+                    sizeof=lambda entry: len(entry[0]))
+
+
+def test_evicts_least_recently_used_past_maxbytes():
+    cache = response_cache(10)
+    cache.set('a', (b'12345', {}))
+    cache.set('b', (b'1234', {}))
+    assert cache.get('a') is not None
+    cache.set('c', (b'123', {}))
+    assert cache.get('b') is None
+    assert cache.stats()['bytes'] == 8
+
+
+def test_skips_entries_over_maxbytes():
+    cache = response_cache(10)
+    cache.set('a', (b'1', {}))
+    cache.set('big', (b'x' * 11, {}))
+    assert cache.get('big') is None
+    assert cache.get('a') is not None
+
+
+def test_replacing_and_invalidating_keep_the_byte_count():
+    cache = response_cache(100)
+    cache.set('"item-1-a"', (b'123', {}))
+    cache.set('"item-1-a"', (b'1', {}))
+    cache.set('"item-12-a"', (b'12', {}))
+    assert cache.stats()['bytes'] == 3
+    cache.invalidate_prefix('"item-1-')
+    assert cache.get('"item-1-a"') is None
+    assert cache.stats()['bytes'] == 2
+    cache.invalidate('"item-12-a"')
+    assert cache.stats()['bytes'] == 0
+
+
+def test_entry_count_bound_without_maxbytes():
+    cache = TTLCache(maxsize=2, ttl=60)
+    for key in 'abc':
+        cache.set(key, key)
+    assert cache.get('a') is None
+    assert 'bytes' not in cache.stats()
@@ -0,0 +1,33 @@
+from sqlalchemy.pool import QueuePool
+
+from app import db
+
+
+def test_sqlite_connections_are_tuned(tmp_path):
+    engine = db.make_engine(f'sqlite:///{tmp_path}/tuned.db')
+    try:
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool.size() == db.POOL_SIZE
+        with engine.connect() as connection:
+            for name, value in db.SQLITE_PRAGMAS.items():
+                actual = connection.exec_driver_sql(
+                    f'PRAGMA {name}'
+                ).scalar()
+                if name == 'synchronous':
+                    # Read back as a number
+                    value = ['OFF', 'NORMAL', 'FULL', 'EXTRA'].index(
+                        value.upper()
+                    )
+                assert str(actual).lower() == str(value).lower(), name
+    finally:
+        engine.dispose()
+
+
+def test_server_databases_recycle_and_ping():
+    options = db.engine_options('postgresql://db.example.com/ratings')
+    assert options == {
+        'pool_size': db.POOL_SIZE,
+        'max_overflow': db.MAX_OVERFLOW,
+        'pool_recycle': db.POOL_RECYCLE,
+        'pool_pre_ping': db.POOL_PRE_PING,
+    }
@@ -0,0 +1,32 @@
+def test_ratings_etag_follows_writes(client, headers, new_item):
+    first = client.get('/ratings', headers=headers)
+    etag = first.headers['etag']
+    assert client.get(
+        '/ratings', headers={**headers, 'If-None-Match': etag}
+    ).status_code == 304
+
+    new_item(headers)
+    changed = client.get(
+        '/ratings', headers={**headers, 'If-None-Match': etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+    assert len(changed.json()) == 1
+
+
+def test_deleted_item_is_not_served_for_its_reused_id(client, headers,
+                                                      new_item):
+    item_id = new_item(headers, title='Old').json()['itemId']
+    old = client.get(f'/item/{item_id}', headers=headers)
+    assert client.delete(f'/item/{item_id}', headers=headers).status_code \
+        == 202
+
+    # SQLite hands the newest item's id out again
+    reused = new_item(headers, title='New').json()['itemId']
+    assert reused == item_id
+    new = client.get(
+        f'/item/{item_id}',
+        headers={**headers, 'If-None-Match': old.headers['etag']},
+    )
+    assert new.status_code == 200
+    assert new.json()['title'] == 'New'
@@ -0,0 +1,23 @@
+import json
+
+from app import crud, db, main
+
+
+def test_export_streams_every_rating_in_batches(client, make_user, new_item,
+                                                monkeypatch):
+    user, headers = make_user()
+    for n in range(5):
+        new_item(headers, title=f'Dish {n}', description=f'"Note" {n}\n')
+    monkeypatch.setattr(main, 'EXPORT_BATCH_SIZE', 2)
+    chunks = []
+    with client.stream('GET', '/ratings/export', headers=headers) as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        chunks.extend(response.iter_text())
+
+    with db.SessionLocal() as session:
+        expected = crud.get_user_ratings(session, user['id'], None)
+    text = ''.join(chunks)
+    assert [json.loads(line) for line in text.splitlines()] == expected
+    # Nothing but one complete row per line
+    assert text.endswith('\n') and text.count('\n') == 5
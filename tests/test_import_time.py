@@ -0,0 +1,8 @@
+from app import cli
+
+
+def test_app_main_imports_within_budget():
+    # The best of three, like check-import-time
+    seconds, loaded = min(cli.import_time('app.main') for _ in range(3))
+    slowest = sorted(loaded, reverse=True)[:5]
+    assert seconds * 1000 <= cli.IMPORT_BUDGET_MS, slowest
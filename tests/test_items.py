@@ -0,0 +1,30 @@
+from sqlalchemy import event, func, select
+
+from app import crud, db, models
+
+
+def count_items(session, title):
+    return session.execute(
+        select(func.count()).where(models.RatingItem.title == title)
+    ).scalar()
+
+
+def test_item_and_first_rating_commit_together(client, make_user):
+    user, _ = make_user()
+    with db.SessionLocal() as session:
+        commits = []
+        event.listen(session, 'after_commit', commits.append)
+        created = crud.create_rating_with_item(session, user['id'], {
+            'category': 'food', 'title': 'One unit',
+        }, {'rating': 5})
+        assert len(commits) == 1
+        item = crud.get_rating_item(session, created.itemId)
+        assert item.stats.rating_count == 1
+
+        # Violates the coordinates check, nothing may be left behind
+        failed = crud.create_rating_with_item(session, user['id'], {
+            'category': 'food', 'title': 'Half placed', 'latitude': 1.0,
+        }, {'rating': 5})
+        assert failed is None
+        assert len(commits) == 1
+        assert count_items(session, 'Half placed') == 0
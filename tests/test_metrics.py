@@ -0,0 +1,35 @@
+import re
+
+from app import metrics
+
+
+def sample(client, name):
+    text = client.get('/metrics').text
+    match = re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_requests_are_counted_by_route_template(client, headers, new_item):
+    item_id = new_item(headers).json()['itemId']
+    requests = ('ratings_http_request_duration_seconds_count'
+                '{method="GET",route="/item/{item_id}",status="200"}')
+    statements = ('ratings_http_request_sql_statements_count'
+                  '{route="/item/{item_id}"}')
+    before = sample(client, requests), sample(client, statements)
+    for _ in range(2):
+        client.get(f'/item/{item_id}', headers=headers)
+    # Request series are split by status, statement counts only by route
+    client.get('/item/999999999', headers=headers)
+    after = sample(client, requests), sample(client, statements)
+    assert after[0] - before[0] == 2
+    assert after[1] - before[1] == 3
+
+
+def test_slow_sampled_requests_are_profiled(client, headers, tmp_path,
+                                            monkeypatch):
+    monkeypatch.setattr(metrics, 'PROFILE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(metrics, 'PROFILE_SLOW_MS', 0.0)
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(tmp_path))
+    assert client.get('/status', headers=headers).status_code == 200
+    profiles = [path.name for path in tmp_path.iterdir()]
+    assert len(profiles) == 1 and '-GET-status-' in profiles[0]
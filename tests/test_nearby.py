@@ -0,0 +1,96 @@
+import itertools
+import math
+import random
+
+import pytest
+from sqlalchemy import insert
+
+from app import crud, db, geo, models
+
+_categories = itertools.count()
+
+# (latitude, longitude, radius_km): near and over both poles, either side
+# of the antimeridian and on it
+CENTERS = [
+    (89.95, 10.0, 20.0),
+    (89.5, -60.0, 100.0),
+    (-89.9, -170.0, 15.0),
+    (-88.0, 179.0, 100.0),
+    (0.0, 179.95, 30.0),
+    (45.0, -179.99, 5.0),
+    (-30.0, 180.0, 50.0),
+    (60.0, -180.0, 80.0),
+    (51.5, -0.1, 1.0),
+]
+
+
+def destination(latitude, longitude, bearing, km):
+    """The point ``km`` from a start point along a compass bearing."""
+    lat, lng, bearing = map(math.radians, (latitude, longitude, bearing))
+    angle = km / geo.EARTH_RADIUS_KM
+    end_lat = math.asin(
+        math.sin(lat) * math.cos(angle)
+        + math.cos(lat) * math.sin(angle) * math.cos(bearing)
+    )
+    end_lng = lng + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat),
+        math.cos(angle) - math.sin(lat) * math.sin(end_lat),
+    )
+    end_lng = (math.degrees(end_lng) + 180) % 360 - 180
+    return math.degrees(end_lat), end_lng
+
+
+def points(latitude, longitude, radius, rng):
+    for _ in range(300):
+        yield destination(latitude, longitude, rng.uniform(0, 360),
+                          rng.uniform(0, 2 * radius))
+    # Just inside and just outside the circle
+    for bearing in range(0, 360, 15):
+        for share in (0.999, 1.001):
+            yield destination(latitude, longitude, bearing, radius * share)
+
+
+def within(latitude, longitude, radius, places):
+    return sorted(
+        (distance, n) for n, (lat, lng) in enumerate(places)
+        if (distance := geo.haversine(latitude, longitude, lat, lng))
+        <= radius
+    )
+
+
+@pytest.mark.parametrize('latitude, longitude, radius', CENTERS)
+def test_bounding_box_covers_the_circle(latitude, longitude, radius):
+    rng = random.Random(f'{latitude} {longitude}')
+    places = list(points(latitude, longitude, radius, rng))
+    bands, ranges = geo.bounding_box(latitude, longitude, radius)
+    assert all(low <= high for low, high in ranges)
+    for _, n in within(latitude, longitude, radius, places):
+        lat, lng = places[n]
+        assert geo.band(lat) in bands, places[n]
+        assert any(low <= lng <= high for low, high in ranges), places[n]
+
+
+@pytest.mark.parametrize('latitude, longitude, radius', CENTERS)
+def test_nearby_items_match_a_full_scan(client, latitude, longitude,
+                                        radius):
+    rng = random.Random(f'{latitude} {longitude}')
+    places = list(points(latitude, longitude, radius, rng))
+    category = f'nearby-{next(_categories)}'
+    with db.SessionLocal() as session:
+        for n, (lat, lng) in enumerate(places):
+            session.execute(insert(models.RatingItem.__table__).values(
+                category=category, title=str(n),
+                latitude=lat, longitude=lng,
+            ))
+        session.commit()
+
+        expected = within(latitude, longitude, radius, places)
+        found = crud.get_nearby_items(
+            session, latitude, longitude, radius, category,
+            limit=len(places),
+        )
+    assert expected
+    assert [int(item.title) for item, _ in found] == [n for _, n in expected]
+    assert [distance for _, distance in found] == pytest.approx(
+        [distance for distance, _ in expected]
+    )
@@ -0,0 +1,65 @@
+import pytest
+
+from app import crud, db
+
+
+def pages(client, headers, url):
+    """Follow X-Next-Cursor from the first page to the last."""
+    rows, cursor = [], None
+    while True:
+        params = {} if cursor is None else {'cursor': cursor}
+        response = client.get(url, headers=headers, params=params)
+        assert response.status_code == 200
+        rows.extend(response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return rows
+
+
+@pytest.mark.parametrize('count', [6, 7])
+def test_rating_pages_cover_every_rating_once(client, make_user, new_item,
+                                              count):
+    _, headers = make_user()
+    for n in range(count):
+        new_item(headers, title=f'Dish {n}')
+    everything = client.get('/ratings?limit=100', headers=headers).json()
+    assert len(everything) == count
+
+    rows = pages(client, headers, '/ratings?limit=3')
+    assert rows == everything
+    rows = pages(client, headers, '/ratings?limit=3&fields=title')
+    assert rows == [
+        {'id': row['id'], 'title': row['title']} for row in everything
+    ]
+
+
+def test_user_pages_cover_every_user_once(client, make_user):
+    for _ in range(4):
+        _, headers = make_user()
+    rows = pages(client, headers, '/users?limit=3')
+    ids = [row['id'] for row in rows]
+    assert ids == sorted(set(ids))
+    with db.SessionLocal() as session:
+        assert ids == [row['id'] for row in crud.get_users(session, None)]
+
+
+def test_fields_projection(client, headers, new_item):
+    new_item(headers, description='Crisp')
+    row, = client.get('/ratings?fields=rating, description,,',
+                      headers=headers).json()
+    # id always comes along, it is the cursor
+    assert list(row) == ['id', 'rating', 'description']
+    assert row['description'] == 'Crisp'
+    user = client.get('/users?limit=1&fields=username,id',
+                      headers=headers).json()[0]
+    assert list(user) == ['username', 'id']
+
+
+@pytest.mark.parametrize('url', ['/ratings', '/users'])
+def test_unknown_fields_are_rejected(client, headers, url):
+    response = client.get(f'{url}?fields=id,password,hashed_password',
+                          headers=headers)
+    assert response.status_code == 400
+    assert response.json()['detail'] == (
+        'Unknown fields: password, hashed_password'
+    )
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks import queryplans
+
+
+def test_crud_queries_use_indexes():
+    problems = queryplans.check()
+    assert not problems, '\n\n'.join(problems)
+
+
+@pytest.mark.parametrize('detail, table', [
+    ('SCAN users', 'users'),
+    ('SCAN TABLE users', 'users'),
+    ('SCAN ratings USING COVERING INDEX ix_ratings_userId_id', 'ratings'),
+    ('SCAN rating_item_stats USING INDEX ix_rating_item_stats_rating_mean',
+     'rating_item_stats'),
+    ('SEARCH ratings USING COVERING INDEX ix_ratings_userId_id (userId=?)',
+     None),
+    ('SEARCH users USING INTEGER PRIMARY KEY (rowid=?)', None),
+])
+def test_index_walks_count_as_full_scans(detail, table):
+    match = queryplans.FULL_SCAN.fullmatch(detail)
+    assert (match and match.group(1)) == table
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+from sqlalchemy import select
+
+from app import crud, db, models, recommend
+
+K = 3
+
+
+def _stored(session):
+    lists = {}
+    for item_id, neighbor_id, score in session.execute(
+        select(models.ItemNeighbor.__table__)
+    ):
+        lists.setdefault(item_id, {})[neighbor_id] = score
+    return lists
+
+
+def _similar(session):
+    """Every positive similarity, from all ratings at once."""
+    matrix, item_ids = recommend.load_matrix(session)
+    scores = {}
+    columns = list(range(len(item_ids)))
+    for column, neighbors, values in recommend.similarities(matrix, columns):
+        scores[int(item_ids[column])] = dict(
+            zip(item_ids[neighbors].tolist(), values.tolist())
+        )
+    return scores
+
+
+def _check(session):
+    stored, similar = _stored(session), _similar(session)
+    for item_id in set(stored) | set(similar):
+        neighbors = stored.get(item_id, {})
+        expected = sorted(similar.get(item_id, {}).values(), reverse=True)
+        # Ties may be broken either way, so compare by score
+        assert sorted(neighbors.values(), reverse=True) == pytest.approx(
+            expected[:K], abs=1e-5
+        ), item_id
+        for neighbor_id, score in neighbors.items():
+            assert score == pytest.approx(
+                similar[item_id][neighbor_id], abs=1e-5
+            )
+
+
+def test_incremental_refresh_matches_a_full_one(client, make_user, new_item):
+    rng = random.Random(7)
+    users = [make_user() for _ in range(6)]
+    items = [
+        new_item(users[0][1], title=f'Dish {n}', rating=rng.randint(1, 5))
+        .json()['itemId']
+        for n in range(10)
+    ]
+    with db.SessionLocal() as session:
+        crud.create_ratings(session, [
+            (user['id'], None, {'itemId': item_id,
+                                'rating': rng.randint(1, 5)})
+            for user, _ in users[1:]
+            for item_id in items
+            if rng.random() < 0.6
+        ])
+        recommend.refresh_neighbors(session, full=True, k=K)
+        _check(session)
+
+        for _ in range(15):
+            # Change a couple of ratings, leaving most items alone
+            user = rng.choice(users[1:])[0]
+            rated = session.execute(
+                select(models.Rating.id, models.Rating.itemId).where(
+                    models.Rating.userId == user['id'],
+                    models.Rating.itemId.in_(items),
+                )
+            ).all()
+            if rated:
+                crud.delete_rating(session, user['id'], rng.choice(rated)[0])
+            rated = {item_id for _, item_id in rated}
+            unrated = [i for i in items if i not in rated]
+            if unrated:
+                crud.create_rating(session, user['id'], {
+                    'itemId': rng.choice(unrated),
+                    'rating': rng.randint(1, 5),
+                })
+            recommend.refresh_neighbors(session, k=K)
+            _check(session)
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import db, main
+
+
+@pytest.fixture
+def use_replica(tmp_path, monkeypatch):
+    """Route reads to a copy of the primary taken when called, which like
+    a lagging replica then misses every later write."""
+    if db.USE_ASYNC_DB:
+        pytest.skip('covers the blocking read sessions')
+    engines = []
+
+    def use_replica():
+        path = tmp_path / 'replica.db'
+        source = sqlite3.connect(db.engine.url.database)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        engines.append(db.make_engine(f'sqlite:///{path}'))
+        monkeypatch.setattr(main, 'ReadSessionLocal', sessionmaker(
+            autocommit=False, autoflush=False, bind=engines[-1]
+        ))
+
+    yield use_replica
+    for engine in engines:
+        engine.dispose()
+
+
+def titles(client, headers):
+    found = client.get('/search', headers=headers, params={'q': 'wombat'})
+    assert found.status_code == 200
+    return [item['title'] for item in found.json()]
+
+
+def test_reads_go_to_the_replica_unless_the_user_just_wrote(
+        client, make_user, new_item, use_replica):
+    _, writer = make_user()
+    _, reader = make_user()
+    use_replica()
+
+    assert new_item(writer, title='Wombat Diner').status_code == 201
+    # The writer reads from the primary, the reader still from the replica
+    assert titles(client, writer) == ['Wombat Diner']
+    assert titles(client, reader) == []
@@ -0,0 +1,26 @@
+def search(client, headers, q):
+    response = client.get('/search', headers=headers, params={'q': q})
+    assert response.status_code == 200
+    return {item['title'] for item in response.json()}
+
+
+def test_search_matches_every_word_as_a_prefix(client, make_user, new_item):
+    _, headers = make_user()
+    _, other = make_user()
+    new_item(headers, title='Quokka Grill', address='12 Harbourside Way')
+    cafe = new_item(headers, title='Quokka Cafe').json()['itemId']
+    rating = client.post('/ratings', headers=other, json={
+        'itemId': cafe, 'rating': 4, 'description': 'Smoky flat white',
+    }).json()['id']
+
+    assert search(client, headers, 'quok') == {'Quokka Grill',
+                                               'Quokka Cafe'}
+    assert search(client, headers, 'QUOKKA gri') == {'Quokka Grill'}
+    assert search(client, headers, 'harbour') == {'Quokka Grill'}
+    assert search(client, headers, 'smoky') == {'Quokka Cafe'}
+    assert search(client, headers, 'quokka nowhere') == set()
+    # Query syntax in the input is read as plain words
+    assert search(client, headers, 'quokka" OR *') == set()
+
+    client.delete(f'/ratings/{rating}', headers=other)
+    assert search(client, headers, 'smoky') == set()
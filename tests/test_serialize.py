@@ -0,0 +1,78 @@
+import asyncio
+import itertools
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import cache, schemas, serialize
+
+_names = itertools.count()
+
+PAGES = [
+    '/users?limit=50',
+    '/users?limit=50&fields=email,id',
+    '/users?limit=50&fields=first_name',
+    '/ratings?limit=50',
+    '/ratings?limit=50&fields=title,rating',
+    '/ratings?limit=50&fields=description',
+]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(serialize, 'orjson', None)
+    elif serialize.orjson is None:
+        pytest.skip('orjson is not installed')
+
+
+@pytest.fixture
+def rater(client, new_item):
+    """A user with awkward names who rated items with awkward text."""
+    n = next(_names)
+    user = client.post('/users', json={
+        'email': f'zoë{n}@example.com', 'username': f'zoë{n}',
+        'password': 'secret', 'first_name': 'Zoë "Z"', 'last_name': None,
+    }).json()
+    token = client.post('/token', json={
+        'email': user['email'], 'password': 'secret',
+    }).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    for title, description in [('Crêpe', 'Très "bon"\n✨'),
+                               ('Plain', None),
+                               ('Back\\slash', '\t ')]:
+        new_item(headers, title=title, description=description)
+    return headers
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_fast_json_pages_match_the_response_model(client, rater, encoder,
+                                                  monkeypatch, page):
+    bodies = []
+    for fast in (False, True):
+        monkeypatch.setattr(serialize, 'FAST_JSON', fast)
+        # Rating pages are cached by etag, build them afresh each time
+        cache.response_cache.clear()
+        response = client.get(page, headers=rater)
+        assert response.status_code == 200
+        bodies.append((response.content, response.headers['content-type']))
+    assert bodies[0] == bodies[1]
+
+
+@pytest.mark.parametrize('schema, row', [
+    (schemas.User, {'id': 1, 'email': 'zoë@example.com', 'username': 'z',
+                    'first_name': 'Zoë "Z"', 'last_name': None}),
+    (schemas.Rating, {'id': 1, 'rating': 5, 'itemId': 2, 'userId': 3,
+                      'description': 'Très "bon"\n✨ ',
+                      'title': 'Back\\slash'}),
+])
+def test_dump_rows_matches_the_response_model(encoder, schema, row):
+    field = create_response_field(name='response', type_=list[schema])
+    rows = [row, {**row, 'id': 2}]
+    content = asyncio.run(
+        serialize_response(field=field, response_content=rows)
+    )
+    expected = JSONResponse(content=content).body
+    assert serialize.dump_rows(rows, serialize.field_list(schema)) == expected
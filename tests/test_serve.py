@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+# Serves with uvicorn.run replaced, reporting what the app would run with
+SCRIPT = '''
+import json, sys, uvicorn
+from app import cli
+
+def run(*args, **kwargs):
+    from app import db
+    print(json.dumps({
+        'dev_mode': db.DEV_MODE,
+        'pool_size': db.engine.pool.size(),
+        'max_overflow': db.engine.pool._max_overflow,
+    }))
+
+uvicorn.run = run
+cli.main(sys.argv[1:])
+'''
+
+
+def test_serve_configures_a_single_worker(tmp_path):
+    env = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{tmp_path}/serve.db',
+        'ASYNC_DATABASE_URL': f'sqlite+aiosqlite:///{tmp_path}/serve.db',
+    }
+    env.pop('RATINGS_DEV_MODE', None)
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT, 'serve', '--workers', '1',
+         '--db-connections', '3'],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert json.loads(output.splitlines()[-1]) == {
+        'dev_mode': False, 'pool_size': 3, 'max_overflow': 0,
+    }
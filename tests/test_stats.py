@@ -0,0 +1,60 @@
+from sqlalchemy import insert, select
+
+from app import crud, db, models
+
+
+def _stats_ids():
+    with db.SessionLocal() as session:
+        return set(session.execute(
+            select(models.RatingItemStats.itemId)
+        ).scalars())
+
+
+def _next_item_id():
+    with db.SessionLocal() as session:
+        return (session.execute(
+            select(models.RatingItem.id).order_by(models.RatingItem.id.desc())
+        ).scalar() or 0) + 1
+
+
+def test_rating_a_missing_item_leaves_the_id_free(client, headers, new_item):
+    item_id = _next_item_id()
+    response = client.post('/ratings', headers=headers,
+                           json={'itemId': item_id, 'rating': 3})
+    assert response.status_code == 404
+    results = client.post('/ratings/bulk', headers=headers, json=[
+        {'itemId': item_id, 'rating': 3},
+    ]).json()
+    assert results[0]['error'] == 'Item not found.'
+    assert item_id not in _stats_ids()
+
+    created = new_item(headers)
+    assert created.status_code == 201
+    assert created.json()['itemId'] == item_id
+    assert client.get(f'/item/{item_id}', headers=headers).status_code == 200
+
+
+def test_batched_ratings_fall_back_for_a_missing_item(client, make_user,
+                                                      new_item):
+    user, headers = make_user()
+    item_id = new_item(make_user()[1]).json()['itemId']
+    missing = _next_item_id()
+    with db.SessionLocal() as session:
+        results = crud.create_ratings(session, [
+            (user['id'], None, {'itemId': item_id, 'rating': 5}),
+            (user['id'], None, {'itemId': missing, 'rating': 5}),
+        ])
+        assert results[0] is not None and results[1] is None
+    assert missing not in _stats_ids()
+
+
+def test_rebuild_drops_aggregates_of_missing_items(client):
+    missing = _next_item_id() + 100
+    with db.SessionLocal() as session:
+        session.execute(insert(models.RatingItemStats.__table__).values(
+            itemId=missing, version=0, rating_count=1, rating_sum=3,
+            rating_mean=3.0, histogram={'3': 1},
+        ))
+        session.commit()
+        crud.rebuild_item_stats(session)
+    assert missing not in _stats_ids()
@@ -0,0 +1,30 @@
+from sqlalchemy import event
+
+from app import auth, cache, db
+
+
+def test_legacy_tokens_look_their_user_up_once(client, make_user):
+    user, _ = make_user()
+    engines = [db.engine]
+    if db.USE_ASYNC_DB:
+        engines.append(db.async_engine.sync_engine)
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count)
+    try:
+        # Tokens issued before they carried the user name it by email
+        for subject in (user['email'], user['email'].upper()):
+            token = auth.create_access_token(data={'sub': subject})
+            response = client.get(
+                '/status', headers={'Authorization': f'Bearer {token}'}
+            )
+            assert response.status_code == 200
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count)
+    assert len(statements) == 1
+    assert cache.user_cache.get(user['email'].lower()).id == user['id']
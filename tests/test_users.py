@@ -0,0 +1,21 @@
+def test_email_and_username_ignore_case(client):
+    user = client.post('/users', json={
+        'email': 'Mixed.Case@Example.com', 'username': 'MixedCase',
+        'password': 'secret',
+    })
+    assert user.status_code == 201
+    login = client.post('/token', json={
+        'email': 'mixed.case@EXAMPLE.COM', 'password': 'secret',
+    })
+    assert login.status_code == 200
+
+    for email, username, detail in [
+        ('MIXED.case@example.com', 'someone-else', 'Email already in use.'),
+        ('someone-else@example.com', 'mixedcase',
+         'Username already in use.'),
+    ]:
+        taken = client.post('/users', json={
+            'email': email, 'username': username, 'password': 'secret',
+        })
+        assert taken.status_code == 400
+        assert taken.json()['detail'] == detail
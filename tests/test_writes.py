@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app import main, writes
+
+
+def test_concurrent_submits_share_a_batch():
+    batches = []
+
+    async def flush(entries):
+        batches.append(entries)
+        return [entry * 2 for entry in entries]
+
+    async def run():
+        writer = writes.BatchWriter(flush, batch_size=10, batch_delay=0.05)
+        results = await asyncio.gather(*(writer.submit(n) for n in range(5)))
+        await writer.close()
+        return results
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def test_failed_flush_fails_every_submit():
+    async def flush(entries):
+        raise RuntimeError('database down')
+
+    async def run():
+        writer = writes.BatchWriter(flush, batch_delay=0.01)
+        results = await asyncio.gather(
+            writer.submit(1), writer.submit(2), return_exceptions=True
+        )
+        await writer.close()
+        return results
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+
+def test_group_commit_falls_back_per_entry(client, make_user):
+    user, headers = make_user()
+    item = {'category': 'food', 'title': 'Group'}
+    entries = [
+        (user['id'], item, {'rating': 4}),
+        # Breaks the latitude and longitude check, failing the batch flush
+        (user['id'], {**item, 'latitude': 1.0}, {'rating': 2}),
+        (user['id'], item, {'rating': 5}),
+    ]
+
+    async def run():
+        results = await asyncio.gather(
+            *(main.rating_writer.submit(entry) for entry in entries)
+        )
+        await main.rating_writer.close()
+        return results
+
+    first, failed, last = asyncio.run(run())
+    assert failed is None
+    assert first.rating == 4 and last.rating == 5
+    ratings = client.get('/ratings', headers=headers).json()
+    assert sorted(r['rating'] for r in ratings) == [4, 5]
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    monkeypatch.setattr(writes, 'WRITE_BEHIND', True)
+
+
+def test_post_rating_through_the_queue(client, make_user, write_behind):
+    _, headers = make_user()
+    created = client.post('/ratings', headers=headers, json={
+        'category': 'food', 'title': 'Queued', 'rating': 3,
+    })
+    assert created.status_code == 201
+    again = client.post('/ratings', headers=headers, json={
+        'itemId': created.json()['itemId'], 'rating': 1,
+    })
+    assert again.status_code == 400
+    assert len(client.get('/ratings', headers=headers).json()) == 1